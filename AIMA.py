@@ -6,8 +6,18 @@ http://aima.cs.berkeley.edu/python/readme.html for more information.
 """
 
 import operator, math, random, copy, sys, os.path, bisect
+from collections import Counter
 from functools import reduce
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _is_ndarray(x):
+    "Is x a NumPy array? Always false if NumPy isn't installed."
+    return numpy is not None and isinstance(x, numpy.ndarray)
+
 #______________________________________________________________________________
 # Simple Data Structures: infinity, Dict, Struct
                 
@@ -237,55 +247,179 @@ def log2(x):
 
 def mode(values):
     """Return the most common value in the list of values.
+    Ties go to the value seen first (for NumPy arrays, the smallest value).
     >>> mode([1, 2, 3, 2])
     2
     """
-    return histogram(values, mode=1)[0][0]
+    if _is_ndarray(values):
+        uniq, counts = numpy.unique(values, return_counts=True)
+        return uniq[counts.argmax()]
+    return Counter(values).most_common(1)[0][0]
+
+def nth_smallest(values, k):
+    """Return the k-th smallest (0-based) of values in expected O(n) time,
+    without sorting.  This is introselect: quickselect with three-way
+    partitioning around a median-of-3 pivot, falling back to sorting
+    whatever is left if the partitions keep coming out lopsided.
+    >>> nth_smallest([5, 1, 4, 2, 3], 0)
+    1
+    >>> nth_smallest([5, 1, 4, 2, 3], 3)
+    4
+    """
+    if _is_ndarray(values):
+        return numpy.partition(values, k)[k]
+    values = list(values)
+    if not 0 <= k < len(values):
+        raise IndexError("k=%r out of range for %d values" % (k, len(values)))
+    depth = 2 * int(math.log(len(values), 2) + 1)
+    while len(values) > 16 and depth > 0:
+        depth -= 1
+        pivot = median(random.sample(values, 3))
+        lows = [x for x in values if x < pivot]
+        if k < len(lows):
+            values = lows
+            continue
+        highs = [x for x in values if x > pivot]
+        num_pivots = len(values) - len(lows) - len(highs)
+        if k < len(lows) + num_pivots:
+            return pivot
+        k -= len(lows) + num_pivots
+        values = highs
+    return sorted(values)[k]
 
 def median(values):
     """Return the middle value, when the values are sorted.
-    If there are an odd number of elements, try to average the middle two.
+    If there are an even number of elements, try to average the middle two.
     If they can't be averaged (e.g. they are strings), choose one at random.
+    The values are never fully sorted -- see nth_smallest().
     >>> median([10, 100, 11])
     11
     >>> median([1, 2, 3, 4])
     2.5
     """
     n = len(values)
-    values = sorted(values)
-    if n % 2 == 1:
-        return values[n/2]
+    if _is_ndarray(values):
+        return numpy.median(values)
+    if n <= 3:
+        values = sorted(values)
+        middle2 = values[(n - 1) // 2:n // 2 + 1]
     else:
-        middle2 = values[(n/2)-1:(n/2)+1]
-        try:
-            return mean(middle2)
-        except TypeError:
-            return random.choice(middle2)
+        middle2 = [nth_smallest(values, (n - 1) // 2)]
+        if n % 2 == 0:
+            middle2.append(nth_smallest(values, n // 2))
+    if len(middle2) == 1:
+        return middle2[0]
+    try:
+        return mean(middle2)
+    except TypeError:
+        return random.choice(middle2)
+
+def quantile(values, q):
+    """Return the q-th quantile (0 <= q <= 1) of values, linearly
+    interpolating between the two nearest order statistics (the same
+    definition as numpy.quantile).  Runs in O(n) time via nth_smallest().
+    >>> quantile([1, 2, 3, 4, 5], 0.5)
+    3
+    >>> quantile([1, 2, 3, 4], 0.25)
+    1.75
+    """
+    if not 0 <= q <= 1:
+        raise ValueError("Quantile must be between 0 and 1: %r" % q)
+    if _is_ndarray(values):
+        return numpy.quantile(values, q)
+    position = (len(values) - 1) * q
+    lowindex = int(math.floor(position))
+    low = nth_smallest(values, lowindex)
+    fraction = position - lowindex
+    if not fraction:
+        return low
+    high = nth_smallest(values, lowindex + 1)
+    return low + (high - low) * fraction
 
 def mean(values):
     """Return the arithmetic average of the values."""
+    if _is_ndarray(values):
+        return values.mean()
     return sum(values) / float(len(values))
 
+def mean_and_variance(values):
+    """Return the mean and (sample) variance of values in a single pass
+    using Welford's algorithm.  values can be any iterable, so this works
+    on generators too.
+    >>> mean_and_variance([2, 4, 4, 4, 5, 5, 7, 9])
+    (5.0, 4.571428571428571)
+    """
+    if _is_ndarray(values):
+        return values.mean(), values.var(ddof=1)
+    n = 0
+    meanval = 0.0
+    sum_sq_diffs = 0.0
+    for x in values:
+        n += 1
+        delta = x - meanval
+        meanval += delta / n
+        sum_sq_diffs += delta * (x - meanval)
+    if n < 2:
+        raise ValueError("Need at least two values for a variance.")
+    return meanval, sum_sq_diffs / (n - 1)
+
 def stddev(values, meanval=None):
     """The standard deviation of a set of values.
     Pass in the mean if you already know it."""
-    if meanval == None: meanval = mean(values)
-    return math.sqrt(sum([(x - meanval)**2 for x in values]) / (len(values)-1))
+    if _is_ndarray(values) and meanval is None:
+        return values.std(ddof=1)
+    if meanval is None:
+        return math.sqrt(mean_and_variance(values)[1])
+    return math.sqrt(sum((x - meanval)**2 for x in values) / (len(values)-1))
 
 def dotproduct(X, Y):
     """Return the sum of the element-wise product of vectors x and y.
     >>> dotproduct([1, 2, 3], [1000, 100, 10])
     1230
     """
-    return sum([x * y for x, y in zip(X, Y)])
+    if _is_ndarray(X) or _is_ndarray(Y):
+        return numpy.dot(X, Y)
+    return sum(map(operator.mul, X, Y))
 
 def vector_add(a, b):
     """Component-wise addition of two vectors.
     >>> vector_add((0, 1), (8, 9))
     (8, 10)
     """
+    if _is_ndarray(a) or _is_ndarray(b):
+        return numpy.add(a, b)
     return tuple(map(operator.add, a, b))
 
+def vector_iadd(a, b):
+    """In-place component-wise addition: add b into a (a list or NumPy
+    array) and return a.  Unlike vector_add, no new vector is created.
+    >>> totals = [1, 2]
+    >>> vector_iadd(totals, (10, 20))
+    [11, 22]
+    """
+    if _is_ndarray(a):
+        a += b
+    else:
+        a[:] = map(operator.add, a, b)
+    return a
+
+def column_sums(rows):
+    """Return a list of the sums of each column of rows (a list of
+    equal-length vectors, or a 2D NumPy array) in a single pass.
+    >>> column_sums([(1, 2), (3, 4), (5, 6)])
+    [9, 12]
+    """
+    if _is_ndarray(rows):
+        return rows.sum(axis=0)
+    rows = iter(rows)
+    try:
+        totals = list(next(rows))
+    except StopIteration:
+        return []
+    for row in rows:
+        vector_iadd(totals, row)
+    return totals
+
 def probability(p):
     "Return true with probability p."
     return p > random.uniform(0.0, 1.0)
@@ -311,6 +445,8 @@ def normalize(numbers, total=1.0):
     >>> normalize([1,2,1])
     [0.25, 0.5, 0.25]
     """
+    if _is_ndarray(numbers):
+        return numbers * (total / numbers.sum())
     k = total / sum(numbers)
     return [k * n for n in numbers]
 
@@ -345,6 +481,8 @@ def clip(vector, lowest, highest):
     >>> clip((-1, 10), (0, 0), (9, 9))
     (0, 9)
     """
+    if _is_ndarray(vector):
+        return numpy.clip(vector, lowest, highest)
     return type(vector)(map(min, map(max, vector, lowest), highest))
 #______________________________________________________________________________
 # Misc Functions
@@ -367,25 +505,13 @@ def caller(n=1):
     import inspect
     return  inspect.getouterframes(inspect.currentframe())[n][3]
 
-def memoize(fn, slot=None):
+def memoize(fn, slot=None, maxsize=None, ttl=None):
     """Memoize fn: make it remember the computed value for any argument list.
     If slot is specified, store result in that slot of first argument.
-    If slot is false, store results in a dictionary."""
-    if slot:
-        def memoized_fn(obj, *args):
-            if hasattr(obj, slot):
-                return getattr(obj, slot)
-            else:
-                val = fn(obj, *args)
-                setattr(obj, slot, val)
-                return val
-    else:
-        def memoized_fn(*args):
-            if args not in memoized_fn.cache:
-                memoized_fn.cache[args] = fn(*args)
-            return memoized_fn.cache[args]
-        memoized_fn.cache = {}
-    return memoized_fn
+    If slot is false, store results in a dictionary (fn.cache), optionally
+    bounded to maxsize entries and/or ttl seconds.  See waterworks.Caching."""
+    from waterworks.Caching import memoize
+    return memoize(fn, slot=slot, maxsize=maxsize, ttl=ttl)
 
 def if_(test, result, alternative):
     """Like C++ and Java's (test ? result : alternative), except
@@ -0,0 +1,168 @@
+"""Runs jobs concurrently on an asyncio event loop, with the same
+addjob()/start() interface as ThreadedJobs.  Good for I/O-bound jobs
+(network requests, waiting on subprocesses) where a thread per job
+would be wasteful: one process can drive thousands of jobs at once.
+
+Jobs can be coroutine functions, which run on the event loop, or plain
+functions, which are run in an executor (a thread pool by default, or
+a process pool for CPU-bound work) so that they don't block the loop.
+
+Example:
+
+>>> import asyncio
+>>> async def fetch(delay, value):
+...     await asyncio.sleep(delay)
+...     return value
+>>> jobs = AsyncJobs(fetch, [(0.02, 'slow'), (0.01, 'fast')], debug=False)
+>>> jobs.addjob(pow, 2, 10) # plain functions run in the executor
+>>> jobs.start()
+['slow', 'fast', 1024]
+"""
+import asyncio, functools, inspect, random
+from concurrent import futures
+
+__all__ = ['AsyncJobs']
+
+class AsyncJobs:
+    def __init__(self, func=None, arglistlist=None, concurrency=100,
+                 timeout=None, debug=True, executor=None):
+        """arglistlist is a list of a list of args.  At most concurrency
+        jobs run at once.  If timeout is given, jobs taking longer than
+        timeout seconds are cancelled and raise asyncio.TimeoutError
+        (addjob() can override this per job).  executor is where plain
+        (non-coroutine) functions run: None for the event loop's default
+        thread pool, 'process' for a process pool, or an existing
+        concurrent.futures.Executor, which won't be shut down."""
+        self.jobsfinished = 0
+        self.jobstodo = 0
+        self.debug = debug
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._executor_kind = executor
+        self._executor = None
+        self._jobs = [] # (func, args, timeout)
+        self._loop = None
+        self._tasks = None # while running: one task per job, in order
+        self._semaphore = None
+        for arglist in arglistlist or []:
+            self.addjob(func, *arglist)
+
+    def addjob(self, func, *arglist, timeout=None):
+        """Add a job: func(*arglist).  If timeout is None, the default
+        timeout from the constructor applies.  Jobs may add more jobs
+        while running (including plain functions running in executor
+        threads); start() waits for those too."""
+        if timeout is None:
+            timeout = self.timeout
+        self.jobstodo += 1
+        if self._tasks is None:
+            self._jobs.append((func, arglist, timeout))
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError: # called from another thread
+            on_loop = False
+        if on_loop:
+            self._start_task(func, arglist, timeout)
+        else:
+            self._loop.call_soon_threadsafe(self._start_task, func, arglist,
+                                            timeout)
+
+    def _start_task(self, func, args, timeout):
+        self._tasks.append(self._loop.create_task(
+            self._run(func, args, timeout)))
+
+    def getjobstodo(self):
+        return self.jobstodo
+
+    def finished(self, args):
+        if self.debug:
+            print("Finished with", args)
+        self.jobsfinished += 1
+
+    def _get_executor(self):
+        if self._executor is None:
+            kind = self._executor_kind
+            if kind == 'process':
+                self._executor = futures.ProcessPoolExecutor()
+            elif kind is None or isinstance(kind, futures.Executor):
+                self._executor = kind
+            else:
+                raise ValueError("Unknown executor: %r" % kind)
+        return self._executor
+
+    async def _call(self, func, args):
+        if inspect.iscoroutinefunction(func):
+            return await func(*args)
+        # a plain function might block (or hog the CPU), so run it in
+        # the executor.  Note that timeouts can't interrupt it there --
+        # it keeps running, but its result is ignored.
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._get_executor(),
+                                            functools.partial(func, *args))
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _run(self, func, args, timeout):
+        async with self._semaphore:
+            if self.debug:
+                print("Starting", args)
+            try:
+                return await asyncio.wait_for(self._call(func, args),
+                                              timeout)
+            finally:
+                self.finished(args)
+
+    async def run(self):
+        """Coroutine version of start(), for when you're already inside
+        an event loop."""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._loop = asyncio.get_running_loop()
+        jobs, self._jobs = self._jobs, []
+        self._tasks = []
+        for job in jobs:
+            self._start_task(*job)
+        try:
+            waited = 0
+            while waited < len(self._tasks): # jobs may have added jobs
+                pending = self._tasks[waited:]
+                waited = len(self._tasks)
+                await asyncio.wait(pending)
+            results = []
+            for task in self._tasks:
+                results.append(task.result())
+            return results
+        finally:
+            for task in self._tasks: # only left running if we're cancelled
+                task.cancel()
+            self._tasks = None
+            self.shutdown()
+
+    def start(self):
+        """Run all jobs in a new event loop and wait until they are
+        done.  Returns their results in the order they were added.  If
+        any job raised an exception (including asyncio.TimeoutError),
+        the first one (in that order) is raised here after all the jobs
+        have finished."""
+        return asyncio.run(self.run())
+
+    def shutdown(self, wait=True):
+        """Stop the process pool, if we made one (run() does this for
+        you).  Executors passed in by the caller are left running."""
+        if self._executor is not None and \
+           not isinstance(self._executor_kind, futures.Executor):
+            self._executor.shutdown(wait=wait)
+        self._executor = None
+
+if __name__ == "__main__":
+    async def sleeper(amount, bogusarg):
+        print("sleeping for", amount)
+        await asyncio.sleep(amount)
+        print("done sleeping for", amount)
+
+    times = [(t / 10.0, 2) for t in range(20)]
+    random.shuffle(times)
+
+    jobs = AsyncJobs(sleeper, times, concurrency=5)
+    jobs.start()
@@ -8,7 +8,6 @@ from PrecRec import precision_recall_f, fscore
 
 # TODO switch to waterworks.Dictionaries.TwoLevelCounterDict
 from AIMA import DefaultDict
-from functools import reduce
 
 class ConfusionMatrix(object):
     def __init__(self):
@@ -134,8 +133,8 @@ class ConfusionMatrix(object):
         elif normalize == 'gold':
             normalize = normalize_row_by_row
         else: # test
-            from AIMA import vector_add
-            column_totals = reduce(vector_add, rows)
+            from AIMA import column_sums
+            column_totals = column_sums(rows)
             def normalize(row):
                 return [1 - (cell / total) 
                     for cell, total in zip(row, column_totals)]
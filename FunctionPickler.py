@@ -1,7 +1,14 @@
 """Allows you to create pickle-able references to functions.  Of course,
 this is with the understanding that the underlying implementation of
 that function can change, so don't use this if you require future-proof
-results."""
+results.
+
+parallel_map() uses these references to run a function over many inputs
+in a pool of worker processes."""
+import os, time, importlib, traceback
+from collections import deque
+from concurrent import futures
+from itertools import islice
 from pickle import PicklingError
 
 class PickledFunction:
@@ -29,7 +36,7 @@ class PickledFunction:
         self.__dict__.update(state)
         self._import()
     def _import(self):
-        mod = __import__(self.modulename)
+        mod = importlib.import_module(self.modulename)
         self._func = getattr(mod, self.name)
     def __getstate__(self):
         state = dict(self.__dict__)
@@ -42,6 +49,104 @@ class PickledFunction:
         """All other attributes are passed onto the function."""
         return getattr(self._func, attr)
 
+# the function each worker process runs (resolved once per worker)
+_worker_function = None
+
+def _init_worker(function):
+    global _worker_function
+    _worker_function = function
+
+def _map_chunk(chunk):
+    """Runs in a worker: returns the results for chunk, the exception
+    (and its formatted traceback) from the first item which failed, if
+    any, and how long they took.  Items after a failure aren't run."""
+    started = time.perf_counter()
+    results = []
+    error = tb = None
+    for item in chunk:
+        try:
+            results.append(_worker_function(item))
+        except Exception as exc:
+            error = exc
+            tb = traceback.format_exc()
+            break
+    return results, error, tb, time.perf_counter() - started
+
+class _ChunkSizer:
+    """Picks chunk sizes so that each chunk takes roughly target
+    seconds, based on a moving average of the time per item.  Chunks
+    start small (so slow functions spread out over the workers right
+    away) and at most double each time."""
+    def __init__(self, target=0.05, maxsize=10000):
+        self.target = target
+        self.maxsize = maxsize
+        self.size = 1
+        self.per_item = None
+    def observe(self, count, elapsed):
+        per_item = elapsed / max(count, 1)
+        if self.per_item is None:
+            self.per_item = per_item
+        else:
+            self.per_item = 0.7 * self.per_item + 0.3 * per_item
+        if self.per_item > 0:
+            ideal = int(self.target / self.per_item)
+        else:
+            ideal = self.maxsize
+        self.size = max(1, min(ideal, 2 * self.size, self.maxsize))
+
+def parallel_map(func, iterable, chunksize='auto', workers=None):
+    """Like map(func, iterable), but calls func in a pool of worker
+    processes (workers defaults to the number of CPUs).  Results are
+    yielded in order as they become available and iterable is read
+    lazily, so it can be very long.
+
+    func is sent to each worker once, as a PickledFunction (so it must
+    be a module-level function, but needn't be picklable otherwise), and
+    the items are sent in chunks.  If chunksize is 'auto', chunks are
+    sized so each takes about 50ms of work, which keeps the workers busy
+    without much communication overhead.  Exceptions raised by func are
+    raised here when their result would have been yielded (after the
+    results for the items before it), with the worker's traceback as
+    their __cause__.
+
+    >>> import math
+    >>> list(parallel_map(math.factorial, range(8), workers=2))
+    [1, 1, 2, 6, 24, 120, 720, 5040]
+    """
+    if not isinstance(func, PickledFunction):
+        func = PickledFunction(func)
+    workers = workers or os.cpu_count() or 1
+    if chunksize == 'auto':
+        sizer = _ChunkSizer()
+    else:
+        sizer = None
+    iterable = iter(iterable)
+    with futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(func,)) as executor:
+        in_flight = deque()
+        def submit():
+            size = sizer.size if sizer else chunksize
+            chunk = list(islice(iterable, size))
+            if chunk:
+                in_flight.append((len(chunk),
+                                  executor.submit(_map_chunk, chunk)))
+            return bool(chunk)
+        for i in range(2 * workers):
+            if not submit():
+                break
+        while in_flight:
+            count, future = in_flight.popleft()
+            results, error, tb, elapsed = future.result()
+            if error is not None:
+                yield from results # the items before the failure
+                from ThreadedJobs import _RemoteTraceback
+                error.__cause__ = _RemoteTraceback(tb)
+                raise error
+            if sizer:
+                sizer.observe(count, elapsed)
+            submit()
+            yield from results
+
 if __name__ == "__main__":
     import time
     import pickle
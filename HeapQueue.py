@@ -1,5 +1,20 @@
 """A more object-oriented wrapper of the heapq module."""
-import heapq
+import heapq, queue, threading, asyncio
+
+def _nsmallest_indices(heap, k, key=lambda entry: entry):
+    """Yields the indices of the k smallest entries of a heap-ordered list
+    in order, without modifying it, by exploring the heap's children
+    with a second (small) heap: O(k log k)."""
+    if not heap or k <= 0:
+        return
+    frontier = [(key(heap[0]), 0)]
+    while frontier and k > 0:
+        value, index = heapq.heappop(frontier)
+        yield index
+        k -= 1
+        for child in (2 * index + 1, 2 * index + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (key(heap[child]), child))
 
 class HeapQueue:
     """Object-oriented way of maintaining heap queue with the heapq module."""
@@ -24,3 +39,318 @@ class HeapQueue:
     def add(self, item):
         """Add an item into the heap."""
         return heapq.heappush(self._heap, item)
+    def pushpop(self, item):
+        """Add item, then remove and return the top element (faster than
+        add() followed by pop())."""
+        return heapq.heappushpop(self._heap, item)
+    def replace(self, item):
+        """Remove and return the top element, then add item (faster than
+        pop() followed by add())."""
+        return heapq.heapreplace(self._heap, item)
+    def nsmallest(self, k):
+        """Returns a sorted list of the k smallest elements without
+        removing them.  Takes O(k log k) time.
+
+        >>> HeapQueue([5, 1, 4, 2, 3]).nsmallest(3)
+        [1, 2, 3]
+        """
+        return [self._heap[index]
+            for index in _nsmallest_indices(self._heap, k)]
+    def merge(self, other):
+        """Add all elements of another HeapQueue (or iterable) to this
+        one.  Returns self.
+
+        >>> q = HeapQueue([2, 1])
+        >>> sorted(q.merge(q))
+        [1, 1, 2, 2]
+        """
+        self._heap.extend(list(other)) # other might be self
+        heapq.heapify(self._heap)
+        return self
+
+class IndexedHeapQueue:
+    """A priority queue of distinct (hashable) items, each with a
+    priority (lowest comes out first).  A map from items to their heap
+    positions makes membership O(1) and lets you change an item's
+    priority or remove it in O(log n).  Items are never compared, only
+    priorities.
+
+    >>> q = IndexedHeapQueue({'a': 3, 'b': 1, 'c': 2})
+    >>> q.update('a', 0)
+    >>> q.remove('c')
+    2
+    >>> 'c' in q, q.pop(), q.popitem()
+    (False, 'a', ('b', 1))
+    """
+    def __init__(self, initial=None):
+        """initial can be a dictionary or a sequence of (item, priority)
+        pairs."""
+        if initial is None:
+            initial = ()
+        elif hasattr(initial, 'items'):
+            initial = initial.items()
+        self._heap = [] # [priority, item] pairs in heap order
+        self._positions = {} # item : index into _heap
+        for item, priority in initial:
+            if item in self._positions:
+                raise ValueError("Duplicate item: %r" % (item,))
+            self._positions[item] = len(self._heap)
+            self._heap.append([priority, item])
+        for index in reversed(range(len(self._heap) // 2)):
+            self._sift_down(index)
+    def __len__(self):
+        return len(self._heap)
+    def __iter__(self):
+        """Iterates over the items (in heap order, not sorted)."""
+        return (item for priority, item in self._heap)
+    def __contains__(self, item):
+        return item in self._positions
+    def priority(self, item):
+        """Returns the priority of item."""
+        return self._heap[self._positions[item]][0]
+
+    def _move(self, entry, index):
+        self._heap[index] = entry
+        self._positions[entry[1]] = index
+    def _sift_up(self, index):
+        heap = self._heap
+        entry = heap[index]
+        while index > 0:
+            parent = (index - 1) // 2
+            if entry[0] < heap[parent][0]:
+                self._move(heap[parent], index)
+                index = parent
+            else:
+                break
+        self._move(entry, index)
+    def _sift_down(self, index):
+        heap = self._heap
+        entry = heap[index]
+        end = len(heap)
+        while 1:
+            child = 2 * index + 1
+            if child >= end:
+                break
+            if child + 1 < end and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if heap[child][0] < entry[0]:
+                self._move(heap[child], index)
+                index = child
+            else:
+                break
+        self._move(entry, index)
+    def _remove_at(self, index):
+        entry = self._heap[index]
+        del self._positions[entry[1]]
+        last = self._heap.pop()
+        if index < len(self._heap):
+            self._move(last, index)
+            self._sift_up(index)
+            self._sift_down(self._positions[last[1]])
+        return entry
+
+    def peek(self):
+        """Look at the item with the lowest priority."""
+        return self._heap[0][1]
+    def pop(self):
+        """Removes and returns the item with the lowest priority."""
+        return self.popitem()[0]
+    def popitem(self):
+        """Removes and returns (item, priority) for the item with the
+        lowest priority."""
+        if not self._heap:
+            raise IndexError("pop from empty heap")
+        priority, item = self._remove_at(0)
+        return item, priority
+    def add(self, item, priority):
+        """Add an item with a priority.  Raises ValueError if item is
+        already in the queue (use update() to change its priority)."""
+        if item in self._positions:
+            raise ValueError("Item already in queue: %r" % (item,))
+        self._heap.append([priority, item])
+        self._positions[item] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+    def update(self, item, priority):
+        """Change the priority of item, adding it if needed."""
+        if item not in self._positions:
+            self.add(item, priority)
+            return
+        index = self._positions[item]
+        self._heap[index][0] = priority
+        self._sift_up(index)
+        self._sift_down(self._positions[item])
+    def remove(self, item):
+        """Remove item from the queue and return its priority.  Raises
+        KeyError if it isn't in the queue."""
+        return self._remove_at(self._positions[item])[0]
+    def pushpop(self, item, priority):
+        """Add item, then remove and return the lowest priority item."""
+        if item in self._positions:
+            raise ValueError("Item already in queue: %r" % (item,))
+        if not self._heap or priority <= self._heap[0][0]:
+            return item
+        top = self._heap[0]
+        del self._positions[top[1]]
+        self._move([priority, item], 0)
+        self._sift_down(0)
+        return top[1]
+    def replace(self, item, priority):
+        """Remove and return the lowest priority item, then add item."""
+        top = self.pop()
+        self.add(item, priority)
+        return top
+    def nsmallest(self, k):
+        """Returns a sorted list of (item, priority) pairs for the k
+        lowest priority items without removing them: O(k log k)."""
+        indices = _nsmallest_indices(self._heap, k,
+                                     key=lambda entry: entry[0])
+        return [(self._heap[index][1], self._heap[index][0])
+            for index in indices]
+    def merge(self, other):
+        """Add all items from another IndexedHeapQueue to this one (their
+        priorities win for items in both).  Returns self."""
+        for priority, item in other._heap:
+            self.update(item, priority)
+        return self
+
+class ConcurrentHeapQueue(HeapQueue):
+    """A thread-safe HeapQueue for producer/consumer pipelines.  pop()
+    blocks until an element is available and, if maxsize is given, add()
+    blocks while the queue is full.  Timeouts raise queue.Empty and
+    queue.Full, like the queue module."""
+    def __init__(self, initial_list=None, maxsize=None):
+        HeapQueue.__init__(self, initial_list)
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+    def __contains__(self, item):
+        with self._lock:
+            return HeapQueue.__contains__(self, item)
+    def _full(self):
+        return self.maxsize is not None and len(self._heap) >= self.maxsize
+    def peek(self):
+        """Look at the top element (raises IndexError if empty)."""
+        with self._lock:
+            return HeapQueue.peek(self)
+    def add(self, item, block=True, timeout=None):
+        """Add an item, waiting up to timeout seconds (forever if None)
+        for room if the queue is full.  If block is False, raises
+        queue.Full immediately instead of waiting."""
+        with self._not_full:
+            if self._full():
+                if not block:
+                    raise queue.Full
+                if not self._not_full.wait_for(lambda: not self._full(),
+                                               timeout):
+                    raise queue.Full
+            heapq.heappush(self._heap, item)
+            self._not_empty.notify()
+    def pop(self, block=True, timeout=None):
+        """Removes and returns the top element, waiting up to timeout
+        seconds (forever if None) for one to be added.  If block is
+        False, raises queue.Empty immediately if there isn't one."""
+        return self.pop_many(1, block=block, timeout=timeout)[0]
+    def pop_many(self, k, block=True, timeout=None):
+        """Removes and returns a list of up to k top elements (in order).
+        Waits like pop() for the first one, but not for the rest."""
+        with self._not_empty:
+            if not self._heap:
+                if not block:
+                    raise queue.Empty
+                if not self._not_empty.wait_for(lambda: self._heap, timeout):
+                    raise queue.Empty
+            items = [heapq.heappop(self._heap)
+                for i in range(min(k, len(self._heap)))]
+            self._not_full.notify(len(items))
+            return items
+    def pushpop(self, item):
+        with self._lock:
+            return HeapQueue.pushpop(self, item)
+    def replace(self, item):
+        with self._lock:
+            return HeapQueue.replace(self, item)
+    def nsmallest(self, k):
+        with self._lock:
+            return HeapQueue.nsmallest(self, k)
+    def merge(self, other):
+        """Add all elements of other, ignoring maxsize.  Returns self."""
+        with self._lock:
+            HeapQueue.merge(self, other)
+            self._not_empty.notify_all()
+        return self
+
+class AsyncHeapQueue(HeapQueue):
+    """An asyncio version of ConcurrentHeapQueue: add() and pop() are
+    coroutines which wait for room or elements.  Timeouts raise
+    asyncio.TimeoutError.  Not thread-safe (use it from one event loop)."""
+    def __init__(self, initial_list=None, maxsize=None):
+        HeapQueue.__init__(self, initial_list)
+        self.maxsize = maxsize
+        self._changed = asyncio.Condition()
+        # the event loop only keeps weak references to tasks, so hold
+        # on to notifications until they've run
+        self._notifications = set()
+    def _full(self):
+        return self.maxsize is not None and len(self._heap) >= self.maxsize
+    async def add(self, item, timeout=None):
+        """Add an item, waiting up to timeout seconds for room."""
+        async with self._changed:
+            await asyncio.wait_for(
+                self._changed.wait_for(lambda: not self._full()), timeout)
+            heapq.heappush(self._heap, item)
+            self._changed.notify_all()
+    async def pop(self, timeout=None):
+        """Removes and returns the top element, waiting up to timeout
+        seconds for one."""
+        return (await self.pop_many(1, timeout=timeout))[0]
+    async def pop_many(self, k, timeout=None):
+        """Removes and returns up to k top elements, waiting up to
+        timeout seconds for the first one."""
+        async with self._changed:
+            await asyncio.wait_for(
+                self._changed.wait_for(lambda: self._heap), timeout)
+            items = [heapq.heappop(self._heap)
+                for i in range(min(k, len(self._heap)))]
+            self._changed.notify_all()
+            return items
+    def merge(self, other):
+        """Add all elements of other, ignoring maxsize, and wake up any
+        coroutines waiting in pop().  Returns self.
+
+        >>> async def pop_during_merge():
+        ...     q = AsyncHeapQueue()
+        ...     popper = asyncio.ensure_future(q.pop(timeout=1))
+        ...     await asyncio.sleep(0.01) # let it start waiting
+        ...     q.merge([3, 1])
+        ...     return await popper
+        >>> asyncio.run(pop_during_merge())
+        1
+        """
+        HeapQueue.merge(self, other)
+        self._wake()
+        return self
+    def add_nowait(self, item):
+        """Add an item or raise asyncio.QueueFull."""
+        if self._full():
+            raise asyncio.QueueFull
+        heapq.heappush(self._heap, item)
+        self._wake()
+    def pop_nowait(self):
+        """Remove and return the top element or raise asyncio.QueueEmpty."""
+        if not self._heap:
+            raise asyncio.QueueEmpty
+        item = heapq.heappop(self._heap)
+        self._wake()
+        return item
+    def _wake(self):
+        async def notify():
+            async with self._changed:
+                self._changed.notify_all()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError: # no running loop, so nobody is waiting
+            return
+        task = loop.create_task(notify())
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
@@ -1,8 +1,15 @@
 """Tools for creating and displaying histograms."""
 import collections
 import math
+from array import array
+from bisect import bisect_right
 from tempfile import NamedTemporaryFile
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def makelogbuckets(minval, maxval, base=2):
     """Attempt to make logarithmic cutoffs for values between minval
     and maxval."""
@@ -63,32 +70,54 @@ def guessuniformbucketsfromdata(data, numbuckets=None, autoshrink=True):
     return bucketer(min(data), max(data), numbuckets, 
                           autoshrink=autoshrink)
 
-# TODO this has some problems
-# uniform number of items in buckets
-def guessuniformcontentsbucketsfromdata(data, numbuckets=None):
-    numitems = len(data)
-    numbuckets = numbuckets or (math.log10(numitems) * 2)
-    items_per_bucket = numitems / float(numbuckets)
+def equal_frequency_cutoffs(data, numbuckets, exact=True):
+    """Returns cutoffs (suitable for HistogramBucketDict) which split
+    data into numbuckets buckets containing the same number of items.
+    The first cutoff is the minimum.  Cutoffs are order statistics of
+    data, so all copies of a value land in the same bucket -- heavily
+    tied values can result in fewer, larger buckets.
 
-    cur_bucket = []
-    cutoffs = []
-    for d in sorted(data):
-        # print ["%.2f" % (zz * 100) for zz in cutoffs], d, len(cur_bucket)
+    With NumPy, the order statistics are found by a single
+    numpy.partition call (O(n log numbuckets)), otherwise by sorting.  If
+    exact is False, they are estimated in constant memory with a
+    QuantileSketch.KLLSketch instead (data can then be any iterable).
 
-        if len(cur_bucket) < items_per_bucket or d == cur_bucket[-1]:
-            cur_bucket.append(d)
-        else:
-            cutoffs.append(d)
-            # cutoffs.append(cur_bucket[0])
-            cur_bucket = [d]
+    >>> equal_frequency_cutoffs([5, 1, 4, 2, 3, 6, 8, 7], 4)
+    [1, 3, 5, 7]
+    >>> equal_frequency_cutoffs([1, 1, 1, 1, 1, 2, 3, 4], 4)
+    [1, 3]
+    """
+    numbuckets = max(int(numbuckets), 1)
+    if not exact:
+        from QuantileSketch import KLLSketch
+        sketch = KLLSketch()
+        sketch.update_many(data)
+        cutoffs = sketch.quantiles([i / float(numbuckets)
+                                    for i in range(numbuckets)])
+        return sorted(set(cutoffs))
 
-    return cutoffs
+    numitems = len(data)
+    ranks = sorted(set((i * numitems) // numbuckets
+                       for i in range(numbuckets)))
+    if numpy is not None:
+        data = numpy.asarray(data)
+        cutoffs = numpy.partition(data, ranks)[ranks].tolist()
+    else:
+        data = sorted(data)
+        cutoffs = [data[rank] for rank in ranks]
+    return sorted(set(cutoffs))
+
+# uniform number of items in buckets
+def guessuniformcontentsbucketsfromdata(data, numbuckets=None, exact=True):
+    """Equal-frequency buckets (see equal_frequency_cutoffs).  If
+    numbuckets isn't given, it's guessed from the size of the data."""
+    numbuckets = numbuckets or (math.log10(len(data)) * 2)
+    return equal_frequency_cutoffs(data, numbuckets, exact=exact)
 
 def bucket_xy_data_by_x(x, y, bucketfunc, **bucketfuncopts):
     buckets = bucketfunc(x, **bucketfuncopts)
     bucketdict = HistogramBucketDict(buckets)
-    for key, val in zip(x, y):
-        bucketdict.add(key, amount=val)
+    bucketdict.add_many(x, amounts=y)
     return bucketdict
 
 class HistogramBucketDict(collections.UserDict):
@@ -99,13 +128,14 @@ class HistogramBucketDict(collections.UserDict):
     def __init__(self, cutoffs, data=None):
         """Create a HistogramBucketDict with cutoff points for buckets."""
         collections.UserDict.__init__(self)
-        cutoffs = list(reversed(cutoffs))
+        self._ascending_cutoffs = sorted(cutoffs)
+        cutoffs = list(reversed(self._ascending_cutoffs))
         self.cutoffs = cutoffs
         self.firstcutoff = cutoffs[0]
         self.lastcutoff = cutoffs[-1]
         for cutoff in cutoffs:
             self[cutoff] = 0
-        if data:
+        if data is not None:
             self.add_all(data)
     def add(self, key, amount=1):
         """Add 'amount' items for a key.  Whichever bucket 'key' is in
@@ -113,15 +143,62 @@ class HistogramBucketDict(collections.UserDict):
         cutoff = self.get_bucket(key)
         self[cutoff] += amount
     def get_bucket(self, key):
-        for cutoff in self.cutoffs:
-            if key >= cutoff:
-                return cutoff
-        else: # last bucket
-            return self.lastcutoff
-        
+        """Returns the cutoff of the bucket that key falls in: the
+        largest cutoff <= key (or the smallest cutoff if there isn't
+        one)."""
+        index = bisect_right(self._ascending_cutoffs, key) - 1
+        return self._ascending_cutoffs[max(index, 0)]
+    def add_many(self, keys, amounts=None):
+        """Like calling add(key, amount) for each key (and amount, if
+        amounts is given, otherwise 1).  With NumPy, all keys are
+        bucketed at once with searchsorted() and bincount() (if keys is
+        a sequence or array -- other iterables are read one at a
+        time)."""
+        if numpy is not None and hasattr(keys, '__len__'):
+            array = numpy.asarray(keys)
+            if amounts is not None:
+                if not hasattr(amounts, '__len__'):
+                    amounts = list(amounts)
+                amounts = numpy.asarray(amounts)
+            if array.dtype.kind in 'biuf' and \
+               (amounts is None or amounts.dtype.kind in 'biuf'):
+                self._add_many_numpy(array, amounts)
+                return
+            if amounts is not None:
+                amounts = amounts.tolist()
+        if amounts is None:
+            for key in keys:
+                self[self.get_bucket(key)] += 1
+        else:
+            for key, amount in zip(keys, amounts):
+                self[self.get_bucket(key)] += amount
+    def _add_many_numpy(self, keys, amounts, chunksize=1 << 20):
+        cutoffs = self._ascending_cutoffs
+        keys = keys.ravel()
+        integral = amounts is None or amounts.dtype.kind in 'biu'
+        if amounts is not None:
+            amounts = amounts.ravel()
+        counts = 0
+        # bucket in chunks so the index arrays stay small
+        for start in range(0, len(keys), chunksize):
+            indices = numpy.searchsorted(cutoffs,
+                keys[start:start + chunksize], side='right') - 1
+            numpy.maximum(indices, 0, out=indices)
+            if amounts is None:
+                weights = None
+            else:
+                weights = amounts[start:start + chunksize]
+            counts = counts + numpy.bincount(indices, weights=weights,
+                                             minlength=len(cutoffs))
+        if not isinstance(counts, numpy.ndarray):
+            return
+        if integral: # bincount() gives floats when there are weights
+            counts = counts.astype(numpy.int64)
+        for cutoff, count in zip(cutoffs, counts.tolist()):
+            if count:
+                self[cutoff] += count
     def add_all(self, data):
-        for item in data:
-            self.add(item)
+        self.add_many(data)
     def bucket_descriptions(self):
         """Get a dictionary descriptions of each bucket.  In the
         description dictionary, keys are the name of the bucket and
@@ -137,6 +214,23 @@ class HistogramBucketDict(collections.UserDict):
         range and the number of items in that range."""
         descs = self.bucket_descriptions()
         return [(descs[k], v) for k, v in collections.UserDict.items(self)]
+    def as_arrays(self, upper=None):
+        """Returns (edges, counts) for the buckets in increasing order:
+        bucket i covers edges[i] to edges[i + 1] and holds counts[i].
+        The last bucket has no upper bound, so its upper edge is upper
+        or, if that's not given, one bucket width past the last cutoff.
+        These are NumPy arrays if NumPy is available, otherwise lists."""
+        cutoffs = self._ascending_cutoffs
+        if upper is None:
+            if len(cutoffs) > 1:
+                upper = cutoffs[-1] + (cutoffs[-1] - cutoffs[-2])
+            else:
+                upper = cutoffs[-1] + 1
+        edges = cutoffs + [upper]
+        counts = [self[cutoff] for cutoff in cutoffs]
+        if numpy is not None:
+            return numpy.array(edges, dtype=float), numpy.array(counts)
+        return edges, counts
     def gnuplot_file(self):
         """Returns a temporary named file which can be used in gnuplot
         to graph this HistogramBucketDict.
@@ -198,6 +292,150 @@ class HistogramBucketDict(collections.UserDict):
         for (start, end), v in list(self.items()):
             self[start] = (v / total) * newmax
 
+class StreamingHistogram:
+    """An online histogram for unbounded streams in bounded memory
+    (Ben-Haim and Tom-Tov, "A Streaming Parallel Decision Tree
+    Algorithm", 2010).  At most max_bins (centroid, count) bins are kept:
+    when a new value would make too many, the two closest bins are
+    merged.  Histograms built separately (e.g. in other processes) can
+    be combined with merge().  Use to_bucket_dict() to get a
+    HistogramBucketDict for display.
+
+    >>> h = StreamingHistogram(max_bins=4)
+    >>> h.update_many([1, 2, 3, 4, 10, 11, 12, 50])
+    >>> h.bins()
+    [(1.5, 2), (3.5, 2), (11.0, 3), (50, 1)]
+    >>> len(h)
+    8
+    """
+    def __init__(self, max_bins=64):
+        self.max_bins = max_bins
+        self.min = None
+        self.max = None
+        self._centroids = []
+        self._counts = []
+    def __len__(self):
+        """Total count of values seen."""
+        return int(sum(self._counts))
+    def __repr__(self):
+        return "<StreamingHistogram %d bins, %d values>" % \
+            (len(self._centroids), len(self))
+    def bins(self):
+        """Returns a list of (centroid, count) pairs in increasing order
+        of centroid."""
+        return list(zip(self._centroids, self._counts))
+
+    def _insert(self, value, count):
+        index = bisect_right(self._centroids, value)
+        if index and self._centroids[index - 1] == value:
+            self._counts[index - 1] += count
+        else:
+            self._centroids.insert(index, value)
+            self._counts.insert(index, count)
+    def _shrink(self):
+        """Merge closest pairs of bins until there are at most max_bins."""
+        centroids, counts = self._centroids, self._counts
+        while len(centroids) > self.max_bins:
+            gaps = [b - a for a, b in zip(centroids, centroids[1:])]
+            i = gaps.index(min(gaps))
+            total = counts[i] + counts[i + 1]
+            centroids[i] = (centroids[i] * counts[i] +
+                            centroids[i + 1] * counts[i + 1]) / float(total)
+            counts[i] = total
+            del centroids[i + 1]
+            del counts[i + 1]
+    def _note_extremes(self, low, high):
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
+    def update(self, value, count=1):
+        """Add count occurrences of value."""
+        self._note_extremes(value, value)
+        self._insert(value, count)
+        self._shrink()
+    def update_many(self, values, chunksize=100000):
+        """Add all values from an iterable or NumPy array.  With NumPy,
+        each chunk of a sequence or array is first summarized into
+        max_bins bins and those are merged in, which is far faster than
+        adding values one at a time.  Other iterables, and sequences too
+        short for the pre-binning to pay off, are added one at a time."""
+        if numpy is not None and hasattr(values, '__len__') and \
+           len(values) > 32 * self.max_bins:
+            array = numpy.asarray(values)
+            if array.dtype.kind in 'biuf':
+                self._update_many_numpy(array.astype(float).ravel(),
+                                        chunksize)
+                return
+        for value in values:
+            self.update(value)
+    def _update_many_numpy(self, values, chunksize):
+        for start in range(0, len(values), chunksize):
+            chunk = values[start:start + chunksize]
+            counts, edges = numpy.histogram(chunk, bins=self.max_bins)
+            indices = numpy.searchsorted(edges[1:-1], chunk, side='right')
+            sums = numpy.bincount(indices, weights=chunk,
+                                  minlength=self.max_bins)
+            chunkbins = StreamingHistogram(self.max_bins)
+            nonempty = counts > 0
+            chunkbins._centroids = (sums[nonempty] /
+                                    counts[nonempty]).tolist()
+            chunkbins._counts = counts[nonempty].tolist()
+            chunkbins.min = float(chunk.min())
+            chunkbins.max = float(chunk.max())
+            self.merge(chunkbins)
+    def merge(self, other):
+        """Add the bins from another StreamingHistogram to this one.
+        Returns self."""
+        if other.min is not None:
+            self._note_extremes(other.min, other.max)
+        for centroid, count in other.bins():
+            self._insert(centroid, count)
+        self._shrink()
+        return self
+
+    def sum_upto(self, value):
+        """Estimate the number of values seen which are <= value."""
+        centroids, counts = self._centroids, self._counts
+        if not centroids or value < self.min:
+            return 0
+        if value >= self.max:
+            return sum(counts)
+        # treat the extremes as empty bins so the tails interpolate too
+        points = [self.min] + centroids + [self.max]
+        weights = [0] + counts + [0]
+        i = bisect_right(points, value) - 1
+        if i >= len(points) - 1:
+            return sum(counts)
+        left, right = points[i], points[i + 1]
+        fraction = (value - left) / float(right - left) if right > left else 0
+        weight_at_value = weights[i] + (weights[i + 1] - weights[i]) * fraction
+        total = sum(weights[:i]) + weights[i] / 2.0
+        return total + (weights[i] + weight_at_value) / 2.0 * fraction
+    def to_bucket_dict(self, cutoffs=None):
+        """Convert to a HistogramBucketDict.  If cutoffs isn't given,
+        there is one bucket per bin, split halfway between centroids
+        and the counts are exact.  Otherwise, bucket counts for the
+        given cutoffs are estimated with sum_upto()."""
+        if cutoffs is None:
+            centroids = self._centroids
+            cutoffs = [self.min] + [(a + b) / 2.0
+                for a, b in zip(centroids, centroids[1:])]
+            bucketdict = HistogramBucketDict(cutoffs)
+            for cutoff, count in zip(cutoffs, self._counts):
+                bucketdict[cutoff] += count
+            return bucketdict
+
+        bucketdict = HistogramBucketDict(cutoffs)
+        cutoffs = bucketdict._ascending_cutoffs
+        # values below the first cutoff belong in the first bucket
+        below = [0] + [self.sum_upto(cutoff) for cutoff in cutoffs[1:]]
+        below.append(sum(self._counts))
+        for index, cutoff in enumerate(cutoffs):
+            bucketdict[cutoff] += below[index + 1] - below[index]
+        return bucketdict
+
 def histogramify(amounts, numbuckets=None, normalize=True, 
                  bucket_guesser=guessuniformbucketsfromdata):
     """Fast, one command Histogram creation for the common case."""
@@ -225,6 +463,67 @@ def gnuplot_histograms(histograms, names, scale='uniform', graph_with='boxes'):
     import os
     os.system('gnuplot %s' % gnuplot_commands.name)
 
+def plot_histograms(histograms, names, ax=None, scale='uniform',
+                    graph_with='bars'):
+    """Draw several histograms on one matplotlib Axes (a new figure's,
+    if ax isn't given) without any temporary files or gnuplot processes.
+    graph_with is 'bars' or 'steps'.  Returns the Axes."""
+    assert graph_with in ('bars', 'steps'), "Unknown style %r" % graph_with
+    if ax is None:
+        import pylab
+        ax = pylab.figure().gca()
+    for histogram, name in zip(histograms, names):
+        edges, counts = histogram.as_arrays()
+        if graph_with == 'bars':
+            ax.bar(edges[:-1], counts, width=numpy.diff(edges),
+                   align='edge', alpha=0.5, label=name)
+        else:
+            ax.stairs(counts, edges, label=name)
+    if scale == 'log':
+        ax.set_yscale('log')
+    ax.legend()
+    return ax
+
+def save_histograms(histograms, names, filename, columns=4, per_page=16,
+                    scale='uniform', graph_with='bars'):
+    """Render many histograms into a single file in-process, one subplot
+    per histogram in a grid with the given number of columns.  If
+    filename ends in .pdf, histograms are spread over as many pages of
+    per_page subplots as needed; other formats get one (possibly very
+    tall) figure.  Figures are created without pyplot, so no display is
+    needed and no global plotting state is touched.  Raises ValueError
+    if there are no histograms."""
+    histograms = list(histograms)
+    names = list(names)
+    if not histograms:
+        raise ValueError("No histograms to save.")
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    if not filename.lower().endswith('.pdf'):
+        per_page = len(histograms)
+    pages = [(histograms[i:i + per_page], names[i:i + per_page])
+        for i in range(0, len(histograms), per_page)]
+
+    def make_page(page_histograms, page_names):
+        rows = int(math.ceil(len(page_histograms) / float(columns)))
+        figure = Figure(figsize=(4 * columns, 3 * rows))
+        axes = figure.subplots(rows, columns, squeeze=False).ravel()
+        for ax, histogram, name in zip(axes, page_histograms, page_names):
+            plot_histograms([histogram], [name], ax=ax, scale=scale,
+                            graph_with=graph_with)
+        for ax in axes[len(page_histograms):]:
+            ax.set_visible(False)
+        figure.tight_layout()
+        return figure
+
+    if filename.lower().endswith('.pdf'):
+        with PdfPages(filename) as pdf:
+            for page in pages:
+                pdf.savefig(make_page(*page))
+    else:
+        make_page(*pages[0]).savefig(filename)
+
 def test_buckets():
     """Test HistogramBucketDict and gnuplot output."""
     h1 = HistogramBucketDict(guesslogbuckets(0, 500, numbuckets=10))
@@ -253,29 +552,127 @@ def test_buckets():
     gnuplot_histograms([h1, h2, h3, h4], ['log 10', 'log 30', 
                                           'uniform 10', 'uniform 30'])
 
+def read_value_chunks(fileobj, chunksize=1 << 22):
+    """Parse whitespace-separated numbers from fileobj (text or binary)
+    in chunks of about chunksize bytes.  Yields a typed array of floats
+    for each chunk (NumPy arrays if NumPy is available, array('d')
+    otherwise), so values never exist as a list of Python floats."""
+    fileobj = getattr(fileobj, 'buffer', fileobj) # read stdin as bytes
+    leftover = b''
+    while 1:
+        chunk = fileobj.read(chunksize)
+        if not chunk:
+            break
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        chunk = leftover + chunk
+        tokens = chunk.split()
+        if tokens and not chunk[-1:].isspace():
+            # last token may continue in the next chunk
+            leftover = tokens.pop()
+        else:
+            leftover = b''
+        if tokens:
+            yield _parse_floats(tokens)
+    if leftover:
+        yield _parse_floats([leftover])
+
+def _parse_floats(tokens):
+    if numpy is not None:
+        return numpy.array(tokens, dtype=float)
+    return array('d', map(float, tokens))
+
+def _minmax(values):
+    if numpy is not None:
+        return float(values.min()), float(values.max())
+    return min(values), max(values)
+
+def load_values(fileobj, chunksize=1 << 22):
+    """Read all numbers from fileobj with read_value_chunks().  Returns
+    (values, minimum, maximum) where values is an array('d') (8 bytes
+    per value).  Use numpy.frombuffer(values) for a NumPy view."""
+    values = array('d')
+    minimum = maximum = None
+    for chunk in read_value_chunks(fileobj, chunksize):
+        low, high = _minmax(chunk)
+        if minimum is None or low < minimum:
+            minimum = low
+        if maximum is None or high > maximum:
+            maximum = high
+        if numpy is not None:
+            values.frombytes(chunk.tobytes())
+        else:
+            values.extend(chunk)
+    return values, minimum, maximum
+
+def autobucket_file(fileobj, numbuckets=None, mode='memory',
+                    chunksize=1 << 22):
+    """Read numbers from fileobj and histogram them with equal-contents
+    buckets.  Returns (HistogramBucketDict, count, minimum, maximum).
+    mode says how much memory to use:
+
+    'memory': keep every value (8 bytes each) for exact cutoffs.
+    'twopass': first pass sketches the distribution (QuantileSketch) for
+               the cutoffs, second pass counts exactly.  fileobj must be
+               seekable.  Uses constant memory.
+    'sketch': one pass, constant memory: cutoffs come from a quantile
+              sketch and counts are estimated by a StreamingHistogram.
+              Works on stdin."""
+    assert mode in ('memory', 'twopass', 'sketch'), "Unknown mode %r" % mode
+    if mode == 'memory':
+        values, minimum, maximum = load_values(fileobj, chunksize)
+        if numpy is not None:
+            values = numpy.frombuffer(values)
+        buckets = guessuniformcontentsbucketsfromdata(values,
+                                                      numbuckets=numbuckets)
+        hist = HistogramBucketDict(buckets)
+        hist.add_many(values)
+        return hist, len(values), minimum, maximum
+
+    from QuantileSketch import KLLSketch
+    sketch = KLLSketch()
+    if mode == 'sketch':
+        streaming = StreamingHistogram(max_bins=256)
+    for chunk in read_value_chunks(fileobj, chunksize):
+        sketch.update_many(chunk)
+        if mode == 'sketch':
+            streaming.update_many(chunk)
+    if not len(sketch):
+        raise ValueError("No values found.")
+    numbuckets = max(int(numbuckets or (math.log10(len(sketch)) * 2)), 1)
+    buckets = sorted(set(sketch.quantiles([i / float(numbuckets)
+        for i in range(numbuckets)])))
+    if mode == 'sketch':
+        hist = streaming.to_bucket_dict(buckets)
+    else:
+        fileobj.seek(0)
+        hist = HistogramBucketDict(buckets)
+        for chunk in read_value_chunks(fileobj, chunksize):
+            hist.add_many(chunk)
+    return hist, len(sketch), sketch.min, sketch.max
+
 def autobucket_from_stdin():
     """Main function for simple automatic bucketing and gnuplot visualization.
     Accepts an optional argument (number of buckets), otherwise attempts to
     guess the number of buckets from the size of your data.  stdin should 
-    include one value (integer or float) per line."""
+    include one value (integer or float) per line.  If --sketch is given,
+    memory use is constant (but counts are estimated)."""
     import sys
     try:
         numbuckets = int(sys.argv[-1])
     except:
         numbuckets = None
+    if '--sketch' in sys.argv[1:]:
+        mode = 'sketch'
+    else:
+        mode = 'memory'
 
-    values = []
-    for line in sys.stdin:
-        if line.strip():
-            values.append(float(line))
-    print("Read", len(values), "values from stdin.")
-    print("Min:", min(values))
-    print("Max:", max(values))
-
-    buckets = guessuniformcontentsbucketsfromdata(values, numbuckets=numbuckets)
-    print("Cutoffs:", buckets)
-    hist = HistogramBucketDict(buckets)
-    hist.add_all(values)
+    hist, count, minimum, maximum = autobucket_file(sys.stdin, numbuckets,
+                                                    mode=mode)
+    print("Read", count, "values from stdin.")
+    print("Min:", minimum)
+    print("Max:", maximum)
+    print("Cutoffs:", hist._ascending_cutoffs)
     print(hist)
     gnuplot_histograms([hist], ['Values'])
 
@@ -1,33 +1,118 @@
 """Integer Range Parser and Generator"""
 import re
-from waterworks.Strings import multisplit
+from bisect import bisect_left, bisect_right
+
+_splitters = {} # tuple of delimiter regexps : compiled regexp
+
+def _splitter(delimiters):
+    """Returns a compiled regexp matching any of delimiters (cached)."""
+    delimiters = tuple(delimiters)
+    try:
+        return _splitters[delimiters]
+    except KeyError:
+        splitter = re.compile('|'.join(["(?:%s)" % delimiter
+            for delimiter in delimiters]))
+        _splitters[delimiters] = splitter
+        return splitter
 
 def parse(string_to_parse, range_markers=(r'-', r'\.\.'), 
-          range_delimiters=(',', ' ')):
+          range_delimiters=(',', ' '), lazy=False):
     """Example:
 
     >>> print(parse("1-7, 20-25, 19, 12, 109-111"))
     [1, 2, 3, 4, 5, 6, 7, 20, 21, 22, 23, 24, 25, 19, 12, 109, 110, 111]
     >>> print(parse("1-7, 20..25, 19, 12, 109-111"))
     [1, 2, 3, 4, 5, 6, 7, 20, 21, 22, 23, 24, 25, 19, 12, 109, 110, 111]
+
+    If lazy is True, returns a RangeList instead of a list, which takes
+    space proportional to the number of segments, not integers:
+
+    >>> jobs = parse("1-1000000000, 5", lazy=True)
+    >>> len(jobs), jobs[-1], 999 in jobs, jobs[2:4]
+    (1000000001, 5, True, RangeList([range(3, 5)]))
     """
-    range_segments = multisplit(string_to_parse, range_delimiters)
-    ints = []
-    for segment in range_segments:
+    range_splitter = _splitter(range_delimiters)
+    marker_splitter = _splitter(range_markers)
+    ranges = []
+    for segment in range_splitter.split(string_to_parse):
+        if not segment:
+            continue
         try:
-            start, end = multisplit(segment, range_markers)
+            start, end = [piece for piece in marker_splitter.split(segment)
+                          if piece]
             start = int(start)
             end = int(end)
-            ints.extend(range(start, end + 1))
+            ranges.append(range(start, end + 1))
         except ValueError:
-            ints.append(int(segment))
+            value = int(segment)
+            ranges.append(range(value, value + 1))
+
+    ranges = RangeList(ranges)
+    if lazy:
+        return ranges
+    return list(ranges)
 
-    return ints
+class RangeList:
+    """A read-only sequence of integers made by concatenating range
+    objects (as returned by parse(..., lazy=True)).  Supports len(),
+    in, iteration, indexing and slicing without materializing the
+    integers.  Unlike a Rangifier, order and duplicates are kept."""
+    def __init__(self, ranges=()):
+        self.ranges = [r for r in ranges if len(r)]
+        self._offsets = [] # index of the first element of each range
+        total = 0
+        for r in self.ranges:
+            self._offsets.append(total)
+            total += len(r)
+        self._length = total
+    def __repr__(self):
+        return "RangeList(%r)" % self.ranges
+    def __len__(self):
+        return self._length
+    def __iter__(self):
+        for r in self.ranges:
+            yield from r
+    def __contains__(self, value):
+        return any(value in r for r in self.ranges)
+    def __eq__(self, other):
+        if isinstance(other, RangeList):
+            return len(self) == len(other) and \
+                all(a == b for a, b in zip(self, other))
+        return NotImplemented
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return RangeList()
+            first = bisect_right(self._offsets, start) - 1
+            last = bisect_right(self._offsets, stop - 1) - 1
+            pieces = []
+            for i in range(first, last + 1):
+                offset = self._offsets[i]
+                pieces.append(self.ranges[i][max(start - offset, 0):
+                                             stop - offset])
+            return RangeList(pieces)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("RangeList index out of range")
+        i = bisect_right(self._offsets, index) - 1
+        return self.ranges[i][index - self._offsets[i]]
+    def to_rangifier(self):
+        """Returns a Rangifier of these integers (sorted, no duplicates)."""
+        rangifier = Rangifier()
+        for r in self.ranges:
+            rangifier.add(r[0], r[-1])
+        return rangifier
 
-# TODO: one can insert a range that is enclosed by an outer range.
-# this shouldn't be possible -- we should use an integer tree
 class Rangifier:
-    """Example:
+    """A set of integers stored as sorted, disjoint, non-adjacent spans.
+    Spans are found by binary search, so adding or removing a span of any
+    size and membership tests take O(log n) comparisons (for n spans).
+
+    Example:
 
     >>> print(Rangifier([1, 5, 6, 2, 3]))
     1-3, 5-6
@@ -39,13 +124,26 @@ class Rangifier:
     1-6
     >>> print(Rangifier("1-6"))
     1-6
+    >>> r = Rangifier("1-10, 20-30")
+    >>> r.add(5, 22); print(r)
+    1-30
+    >>> r.remove(10, 12); print(r)
+    1-9, 13-30
+    >>> 11 in r, 13 in r, len(r)
+    (False, True, 27)
+    >>> print(Rangifier("1-10") & Rangifier("5-7, 9-20"))
+    5-7, 9-10
+    >>> print(Rangifier("1-3") | Rangifier("5"))
+    1-3, 5
     """
-    def __init__(self, seq):
-        self.starts = {} # start : (start, end)
-        self.ends = {}   # end : (start, end)
+    def __init__(self, seq=()):
+        self._starts = [] # parallel sorted lists: span i is
+        self._ends = []   # _starts[i] to _ends[i], inclusive
 
         if isinstance(seq, str):
-            seq = parse(seq)
+            for r in parse(seq, lazy=True).ranges:
+                self.add(r[0], r[-1])
+            return
 
         for elt in seq:
             elt = int(elt)
@@ -61,43 +159,86 @@ class Rangifier:
         return ', '.join(pieces)
     __repr__ = __str__
     def __iter__(self):
-        for (start, end) in self.get_ranges():
+        for (start, end) in zip(self._starts, self._ends):
             yield from range(start, end + 1)
-    def add(self, newstart, newend):
-        newrange = (newstart, newend)
-        oldrange = None
-        if newstart - 1 in self.ends:
-            oldrange = self.ends[newstart - 1]
-            newrange = self._merge_ranges((newstart - 1, newend), oldrange)
-        elif newend + 1 in self.starts:
-            oldrange = self.starts[newend + 1]
-            newrange = self._merge_ranges((newstart, newend + 1), oldrange)
-        if oldrange:
-            self._forget_range(oldrange)
-            # try to do further merges
-            self.add(*newrange)
-        else:
-            self._store_range(newrange)
-    def _merge_ranges(self, range1, range2):
-        start1, end1 = range1
-        start2, end2 = range2
-
-        if start1 == end2:
-            return (start2, end1)
-        elif start2 == end1:
-            return (start1, end2)
-        
-        raise IndexError(range1, range2)
-    def _store_range(self, range):
-        start, end = range
-        self.starts[start] = range
-        self.ends[end] = range
-    def _forget_range(self, start_and_end):
-        del self.starts[start_and_end[0]]
-        del self.ends[start_and_end[1]]
+    def __len__(self):
+        """Number of integers in the set."""
+        return sum(self._ends) - sum(self._starts) + len(self._starts)
+    def __bool__(self):
+        return bool(self._starts)
+    def __contains__(self, value):
+        index = bisect_right(self._starts, value) - 1
+        return index >= 0 and self._ends[index] >= value
+    def __eq__(self, other):
+        if not isinstance(other, Rangifier):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+    def copy(self):
+        new = Rangifier()
+        new._starts = list(self._starts)
+        new._ends = list(self._ends)
+        return new
+
+    def add(self, newstart, newend=None):
+        """Add all integers from newstart to newend (inclusive) to the
+        set.  The span may overlap, enclose or touch existing spans."""
+        if newend is None:
+            newend = newstart
+        if newend < newstart:
+            raise ValueError("Bad range: %r-%r" % (newstart, newend))
+        # spans [first, last) overlap or are adjacent to the new one
+        first = bisect_left(self._ends, newstart - 1)
+        last = bisect_right(self._starts, newend + 1)
+        if first < last:
+            newstart = min(newstart, self._starts[first])
+            newend = max(newend, self._ends[last - 1])
+        self._starts[first:last] = [newstart]
+        self._ends[first:last] = [newend]
+    def remove(self, start, end=None):
+        """Remove all integers from start to end (inclusive) from the
+        set.  It's fine if some or all of them aren't in the set."""
+        if end is None:
+            end = start
+        first = bisect_left(self._ends, start)
+        last = bisect_right(self._starts, end)
+        if first >= last:
+            return
+        starts, ends = [], []
+        if self._starts[first] < start:
+            starts.append(self._starts[first])
+            ends.append(start - 1)
+        if self._ends[last - 1] > end:
+            starts.append(end + 1)
+            ends.append(self._ends[last - 1])
+        self._starts[first:last] = starts
+        self._ends[first:last] = ends
+    def union(self, other):
+        """Returns a new Rangifier with the integers in either set."""
+        new = self.copy()
+        for start, end in other.get_ranges():
+            new.add(start, end)
+        return new
+    __or__ = union
+    def intersection(self, other):
+        """Returns a new Rangifier with the integers in both sets."""
+        new = Rangifier()
+        mine, theirs = self.get_ranges(), other.get_ranges()
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            start = max(mine[i][0], theirs[j][0])
+            end = min(mine[i][1], theirs[j][1])
+            if start <= end:
+                new._starts.append(start)
+                new._ends.append(end)
+            if mine[i][1] < theirs[j][1]:
+                i += 1
+            else:
+                j += 1
+        return new
+    __and__ = intersection
     def get_ranges(self):
-        ranges = sorted(self.ends.values())
-        return ranges
+        """Returns a sorted list of (start, end) pairs (inclusive)."""
+        return list(zip(self._starts, self._ends))
 
 def test_module():
     import doctest, IntRange # !!!
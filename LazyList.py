@@ -1,42 +1,90 @@
 """Lets you treat an interator as a list by filling in the list on demand."""
+import pickle, tempfile
+from collections import OrderedDict
+from itertools import islice
 
 class LazyList:
-    def __init__(self, iterator, use_partial_list=False):
+    """Example:
+
+    >>> l = LazyList(iter(range(100)), chunksize=10)
+    >>> l[3:6]
+    [3, 4, 5]
+    >>> len(l) # only one chunk has been read
+    10
+    >>> v = l.view(95)
+    >>> list(v), len(l)
+    ([95, 96, 97, 98, 99], 100)
+    """
+    def __init__(self, iterator, use_partial_list=False, chunksize=1):
+        """iterator is only read as far as needed, chunksize items at a
+        time.  If use_partial_list is True, list methods (e.g. index())
+        operate on what has been read so far instead of reading
+        everything first."""
         self.list_so_far = []
-        self.iterator = iterator
+        self.iterator = iter(iterator)
         self.iterator_exhausted = False
         self.use_partial_list = use_partial_list
+        self.chunksize = max(chunksize, 1)
     def __iter__(self):
         i = 0
         while 1:
-            try:
-                yield self[i]
-            except IndexError:
-                raise StopIteration
+            if i >= len(self.list_so_far):
+                self._read_upto(i + 1)
+                if i >= len(self.list_so_far):
+                    return
+            yield self.list_so_far[i]
             i += 1
     def __getitem__(self, index):
-        # TODO doesn't handle slices currently -- reads entire list whenever
-        # you ask for these!
         if not self.iterator_exhausted:
-            if isinstance(index, slice) or index < 0:
+            if isinstance(index, slice):
+                needed = self._slice_extent(index)
+                if needed is None:
+                    self._read_all()
+                else:
+                    self._read_upto(needed)
+            elif index < 0:
                 self._read_all()
-            if not isinstance(index, slice) and index >= len(self.list_so_far):
-                self._read_many(index - len(self.list_so_far) + 1)
+            else:
+                self._read_upto(index + 1)
 
         return self.list_so_far[index]
+    def _slice_extent(self, index):
+        """Returns how many items need to be read for a slice, or None
+        if it depends on the total length (negative or open-ended
+        bounds)."""
+        start, stop, step = index.start, index.stop, index.step
+        if step is None or step > 0:
+            if stop is None or stop < 0 or (start is not None and start < 0):
+                return None
+            return stop
+        else:
+            if start is None or start < 0 or (stop is not None and stop < 0):
+                return None
+            return start + 1
+    def view(self, start=0, stop=None, step=1):
+        """Returns a LazyListView: like self[start:stop:step], but
+        without copying or reading anything until it is used."""
+        return LazyListView(self, start, stop, step)
+    def _read_upto(self, count):
+        """Make sure at least count items have been read (if there are
+        that many)."""
+        if count > len(self):
+            self._read_many(count - len(self))
     def _read_many(self, count):
-        for x in range(count):
-            self._read_iterator()
-            if self.iterator_exhausted:
-                break
+        if self.iterator_exhausted:
+            return
+        # round up to a whole number of chunks
+        count = -(-count // self.chunksize) * self.chunksize
+        before = len(self.list_so_far)
+        self.list_so_far.extend(islice(self.iterator, count))
+        if len(self.list_so_far) - before < count:
+            self.iterator_exhausted = True
     def _read_all(self):
-        while not self.iterator_exhausted:
-            self._read_iterator()
-    def _read_iterator(self):
-        try:
-            self.list_so_far.append(next(self.iterator))
-        except StopIteration:
+        if not self.iterator_exhausted:
+            self.list_so_far.extend(self.iterator)
             self.iterator_exhausted = True
+    def _read_iterator(self):
+        self._read_many(1)
 
     def __getattr__(self, attr):
         if not self.use_partial_list:
@@ -45,6 +93,146 @@ class LazyList:
     def __len__(self):
         return len(self.list_so_far)
 
+class LazyListView:
+    """A read-only window onto a LazyList (like itertools.islice, but
+    indexable and reusable).  start, stop and step must be non-negative
+    (stop may be None for "until the end")."""
+    def __init__(self, lazylist, start=0, stop=None, step=1):
+        if start < 0 or (stop is not None and stop < 0) or step < 1:
+            raise ValueError("LazyListView needs non-negative bounds.")
+        self.lazylist = lazylist
+        self.start = start
+        self.stop = stop
+        self.step = step
+    def __repr__(self):
+        return "<LazyListView [%s:%s:%s] of %r>" % \
+            (self.start, self.stop, self.step, self.lazylist)
+    def __iter__(self):
+        index = self.start
+        while self.stop is None or index < self.stop:
+            try:
+                yield self.lazylist[index]
+            except IndexError:
+                return
+            index += self.step
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        real_index = self.start + index * self.step
+        if index < 0 or (self.stop is not None and real_index >= self.stop):
+            raise IndexError("LazyListView index out of range")
+        return self.lazylist[real_index]
+    def __len__(self):
+        """Reads as far as stop (or everything, if stop is None)."""
+        if self.stop is None:
+            self.lazylist._read_all()
+            stop = len(self.lazylist)
+        else:
+            self.lazylist._read_upto(self.stop)
+            stop = min(self.stop, len(self.lazylist))
+        return len(range(self.start, stop, self.step))
+
+class SpillingLazyList(LazyList):
+    """A LazyList which keeps at most max_chunks chunks of chunksize items
+    in memory.  The least recently used chunks are pickled to a temporary
+    file (in spill_dir, if given) and loaded again when they're needed,
+    so you can index into streams larger than memory.  Items must be
+    picklable.  list methods aren't available since there's no
+    list_so_far.
+
+    >>> l = SpillingLazyList(iter(range(1000)), chunksize=10, max_chunks=2)
+    >>> l[500], l[3], l[-1], len(l)
+    (500, 3, 999, 1000)
+    >>> l.chunks_in_memory()
+    2
+    >>> l[5:8]
+    [5, 6, 7]
+    """
+    def __init__(self, iterator, chunksize=10000, max_chunks=8,
+                 spill_dir=None):
+        self.iterator = iter(iterator)
+        self.iterator_exhausted = False
+        self.use_partial_list = True
+        self.chunksize = max(chunksize, 1)
+        self.max_chunks = max(max_chunks, 1)
+        self._length = 0
+        self._chunks = OrderedDict() # chunk number : list (oldest first)
+        self._spilled = {} # chunk number : (offset, size) in _spill_file
+        self._spill_file = tempfile.TemporaryFile(dir=spill_dir)
+    def __len__(self):
+        """Number of items read so far."""
+        return self._length
+    def __getattr__(self, attr):
+        raise AttributeError(attr)
+    def close(self):
+        """Delete the spill file.  The list can't be used afterwards."""
+        self._spill_file.close()
+        self._chunks.clear()
+
+    def _read_many(self, count):
+        while count > 0 and not self.iterator_exhausted:
+            chunk = list(islice(self.iterator, self.chunksize))
+            if len(chunk) < self.chunksize:
+                self.iterator_exhausted = True
+            if chunk:
+                self._remember(self._length // self.chunksize, chunk)
+                self._length += len(chunk)
+            count -= self.chunksize
+    def _read_all(self):
+        while not self.iterator_exhausted:
+            self._read_many(self.chunksize)
+    def _remember(self, number, chunk):
+        self._chunks[number] = chunk
+        while len(self._chunks) > self.max_chunks:
+            oldnumber, oldchunk = self._chunks.popitem(last=False)
+            if oldnumber not in self._spilled: # chunks never change
+                self._spill_file.seek(0, 2)
+                data = pickle.dumps(oldchunk, pickle.HIGHEST_PROTOCOL)
+                self._spilled[oldnumber] = (self._spill_file.tell(),
+                                            len(data))
+                self._spill_file.write(data)
+    def _chunk(self, number):
+        try:
+            self._chunks.move_to_end(number)
+            return self._chunks[number]
+        except KeyError:
+            offset, size = self._spilled[number]
+            self._spill_file.seek(offset)
+            chunk = pickle.loads(self._spill_file.read(size))
+            self._remember(number, chunk)
+            return chunk
+    def chunks_in_memory(self):
+        return len(self._chunks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if not self.iterator_exhausted:
+                needed = self._slice_extent(index)
+                if needed is None:
+                    self._read_all()
+                else:
+                    self._read_upto(needed)
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            self._read_all()
+            index += self._length
+        else:
+            self._read_upto(index + 1)
+        if not 0 <= index < self._length:
+            raise IndexError("SpillingLazyList index out of range")
+        number, position = divmod(index, self.chunksize)
+        return self._chunk(number)[position]
+    def __iter__(self):
+        number = 0
+        while 1:
+            self._read_upto((number + 1) * self.chunksize)
+            if number * self.chunksize >= self._length:
+                return
+            yield from self._chunk(number)
+            number += 1
+
 if __name__ == "__main__":
     def g():
         for x in range(10):
@@ -0,0 +1,178 @@
+"""Mergeable streaming quantile sketches.
+
+The statistics functions in AIMA (median, quantile, stddev) need all of
+the values in memory.  KLLSketch answers quantile queries over an
+unbounded stream using O(k log(n/k)) memory and can be merged with
+sketches built elsewhere (e.g. in other processes -- sketches pickle
+fine), so workers can each summarize their own stream and a collector
+can combine them.
+
+Example:
+
+>>> sketch = KLLSketch()
+>>> sketch.update_many(range(100000))
+>>> len(sketch)
+100000
+>>> abs(sketch.quantile(0.5) - 50000) < 2000
+True
+
+Based on "Optimal Quantile Approximation in Streams" by Karnin, Lang
+and Liberty (2016).
+"""
+import math, random
+from itertools import islice
+
+__all__ = ['KLLSketch']
+
+class KLLSketch:
+    """KLL quantile sketch.  Values must be mutually comparable (they
+    don't have to be numbers, though only numbers are meaningful to
+    average).  k controls the accuracy/memory tradeoff: the rank error
+    is roughly 1.7/k of the number of values seen."""
+    def __init__(self, k=200, c=2.0 / 3.0):
+        self.k = int(k)
+        self.c = c
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._compactors = []
+        self._size = 0 # number of items currently stored
+        self._maxsize = 0
+        self._grow()
+    def __len__(self):
+        """Number of values seen (not the number of values stored)."""
+        return self.count
+    def __repr__(self):
+        return "<KLLSketch k=%d, %d values, %d stored>" % \
+            (self.k, self.count, self._size)
+
+    def _capacity(self, height):
+        depth = len(self._compactors) - height - 1
+        return int(math.ceil((self.c ** depth) * self.k)) + 1
+    def _grow(self):
+        self._compactors.append([])
+        self._maxsize = sum(self._capacity(height)
+            for height in range(len(self._compactors)))
+    def _compress(self):
+        """Compact the lowest level that is over capacity: sort it and
+        promote every other item (from a random offset) to the next
+        level, where it stands for twice as many values."""
+        for height, compactor in enumerate(self._compactors):
+            if len(compactor) >= self._capacity(height):
+                if height + 1 >= len(self._compactors):
+                    self._grow()
+                compactor.sort()
+                leftover = len(compactor) % 2
+                offset = leftover + random.randrange(2)
+                self._compactors[height + 1].extend(compactor[offset::2])
+                del compactor[leftover:]
+                self._size = sum(len(c) for c in self._compactors)
+                break
+    def _note_extremes(self, low, high):
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
+    def update(self, value):
+        """Add a single value to the sketch."""
+        self._compactors[0].append(value)
+        self._size += 1
+        self.count += 1
+        self._note_extremes(value, value)
+        if self._size >= self._maxsize:
+            self._compress()
+    def update_many(self, values):
+        """Add all values from an iterable (or NumPy array) to the
+        sketch.  Values are added in chunks which fill the sketch up to
+        its current capacity, so this is much faster than calling
+        update() repeatedly."""
+        is_array = hasattr(values, 'tolist') and hasattr(values, 'shape')
+        if is_array:
+            values = values.ravel()
+        else:
+            values = iter(values)
+        start = 0
+        while 1:
+            room = max(self._maxsize - self._size, 1)
+            if is_array:
+                chunk = values[start:start + room].tolist()
+                start += room
+            else:
+                chunk = list(islice(values, room))
+            if not chunk:
+                break
+            self._compactors[0].extend(chunk)
+            self._size += len(chunk)
+            self.count += len(chunk)
+            self._note_extremes(min(chunk), max(chunk))
+            while self._size >= self._maxsize:
+                self._compress()
+    def merge(self, other):
+        """Merge another KLLSketch into this one.  Afterwards, this
+        sketch summarizes the values from both.  Returns self."""
+        while len(self._compactors) < len(other._compactors):
+            self._grow()
+        for height, compactor in enumerate(other._compactors):
+            self._compactors[height].extend(compactor)
+        self.count += other.count
+        if other.count:
+            self._note_extremes(other.min, other.max)
+        self._size = sum(len(c) for c in self._compactors)
+        while self._size >= self._maxsize:
+            self._compress()
+        return self
+
+    def _weighted_items(self):
+        """Returns a sorted list of (value, weight) pairs."""
+        items = []
+        for height, compactor in enumerate(self._compactors):
+            weight = 2 ** height
+            items.extend((value, weight) for value in compactor)
+        items.sort(key=lambda item: item[0])
+        return items
+    def quantiles(self, qs):
+        """Estimate several quantiles at once (each 0 <= q <= 1).
+        Returns a list in the same order as qs."""
+        if not self.count:
+            raise ValueError("Can't take quantiles of an empty sketch.")
+        items = self._weighted_items()
+        total = sum(weight for value, weight in items)
+        results = {}
+        for q in qs:
+            if not 0 <= q <= 1:
+                raise ValueError("Quantile must be between 0 and 1: %r" % q)
+        order = sorted(range(len(qs)), key=lambda i: qs[i])
+        index = 0
+        cumulative = items[0][1]
+        for i in order:
+            q = qs[i]
+            if q == 0:
+                results[i] = self.min
+            elif q == 1:
+                results[i] = self.max
+            else:
+                target = q * total
+                while cumulative < target and index + 1 < len(items):
+                    index += 1
+                    cumulative += items[index][1]
+                results[i] = items[index][0]
+        return [results[i] for i in range(len(qs))]
+    def quantile(self, q):
+        """Estimate the q-th quantile (0 <= q <= 1) of the values seen.
+        quantile(0) and quantile(1) are the exact min and max."""
+        return self.quantiles([q])[0]
+    def rank(self, value):
+        """Estimate how many of the values seen are <= value."""
+        return sum(2 ** height
+            for height, compactor in enumerate(self._compactors)
+                for item in compactor if item <= value)
+    def cdf(self, value):
+        """Estimate the fraction of the values seen which are <= value."""
+        if not self.count:
+            raise ValueError("Can't take the CDF of an empty sketch.")
+        return self.rank(value) / float(self.count)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -16,6 +16,15 @@ t.pollloop(printer)
 See pydoc for the other tailing modes (modes are pollloop, poll,
 multipoll) by doing 'pydoc Tailer' in this directory.
 
+On Linux, pollloop() and TailedFile.select() sleep until inotify says a
+file (or the directory holding it) has changed, so tailing hundreds of
+quiet files costs nothing.  Elsewhere (or with backend='poll') they
+fall back to checking the files' sizes every interval seconds.
+
+In asyncio programs, use Tailer.stream() or Tailer.lines() instead:
+    async for filename, line in Tailer(file1, file2).lines():
+        ...
+
 Known bugs:
     It doesn't handle the case when a file is alterred in the middle very well.
 
@@ -26,93 +35,534 @@ feature requests, patches, whatever.
 __version__ = 2.1
 __author__ = 'David McClosky (dmcc+py AT bigasterisk DOT com)'
 
-import os, sys, time, select
+import os, sys, time, select, struct, errno, asyncio, json, threading
+
+__all__ = ['TailedFile', 'TailInterface', 'Tailer', 'InotifyWatcher',
+           'PollingWatcher', 'make_watcher', 'tail']
+
+def tail(filename, n=10):
+    """Returns a list of the last n lines of a file (as bytes, with
+    their newlines), like tail -n.  Only the end of the file is read, in
+    large blocks, so this is fast even on huge files."""
+    from cookbook.backwardsreader import BackwardsReader
+    lines = []
+    if n <= 0:
+        return lines
+    with open(filename, 'rb') as f:
+        for line in BackwardsReader(f):
+            lines.append(line)
+            if len(lines) >= n:
+                break
+    lines.reverse()
+    return lines
+
+class PollingWatcher:
+    """Watches files for changes by checking their size and modification
+    time every interval seconds.  Works everywhere."""
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self._stats = {} # path : (size, mtime, inode) or None if missing
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+    def add(self, path):
+        path = os.path.abspath(path)
+        self._stats[path] = self._stat(path)
+    def remove(self, path):
+        self._stats.pop(os.path.abspath(path), None)
+    def fileno(self):
+        """There's nothing to select() on when polling."""
+        return None
+    def check(self):
+        """Returns the set of paths which have changed since the last
+        check (or wait())."""
+        changed = set()
+        for path, old in list(self._stats.items()):
+            new = self._stat(path)
+            if new != old:
+                self._stats[path] = new
+                changed.add(path)
+        return changed
+    def wait(self, timeout=None):
+        """Waits until at least one file has changed (or until timeout
+        seconds have passed) and returns the set of changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while 1:
+            changed = self.check()
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+    def close(self):
+        self._stats.clear()
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+_FILE_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF |
+                IN_MOVE_SELF)
+# directories are watched so that we notice files being created,
+# replaced or rotated
+_DIR_EVENTS = IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+_EVENT_HEADER = struct.Struct('iIII')
+
+def _load_libc():
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None,
+                           use_errno=True)
+        libc.inotify_init1 # make sure inotify is there
+    except (ImportError, OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+class InotifyWatcher:
+    """Watches files for changes with Linux's inotify (through ctypes),
+    so waiting costs nothing until something happens.  Each file's
+    directory is watched too, so files which are created, replaced or
+    rotated after add() are still noticed.  fileno() is readable when
+    there are events, so the watcher can be used with select() or an
+    event loop."""
+    _libc = None
+    def __init__(self):
+        if InotifyWatcher._libc is None:
+            InotifyWatcher._libc = _load_libc() or False
+        if not self._libc:
+            raise OSError(errno.ENOSYS, "inotify isn't available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            self._raise_errno()
+        self._paths = set()
+        self._file_watches = {} # watch descriptor : path
+        self._dir_watches = {} # watch descriptor : directory
+        self._watches = {} # path or directory : watch descriptor
+    def _raise_errno(self, filename=None):
+        import ctypes
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), filename)
+    def _watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise_errno(path)
+        return wd
+    def _watch_file(self, path):
+        """(Re)watch path itself, if it exists.  Returns whether it does."""
+        try:
+            wd = self._watch(path, _FILE_EVENTS)
+        except FileNotFoundError:
+            return False
+        self._file_watches[wd] = path
+        self._watches[path] = wd
+        return True
+    def add(self, path):
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        if directory not in self._watches:
+            wd = self._watch(directory, _DIR_EVENTS)
+            self._dir_watches[wd] = directory
+            self._watches[directory] = wd
+        self._paths.add(path)
+        self._watch_file(path)
+    def remove(self, path):
+        path = os.path.abspath(path)
+        self._paths.discard(path)
+        wd = self._watches.pop(path, None)
+        if wd is not None:
+            self._file_watches.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+        directory = os.path.dirname(path)
+        if not any(os.path.dirname(other) == directory
+                   for other in self._paths):
+            wd = self._watches.pop(directory, None)
+            if wd is not None:
+                del self._dir_watches[wd]
+                self._libc.inotify_rm_watch(self._fd, wd)
+    def fileno(self):
+        return self._fd
+    def check(self):
+        """Returns the set of paths with events waiting (without
+        blocking)."""
+        changed = set()
+        while 1:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = \
+                    _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW: # lost events, so check everything
+                    changed.update(self._paths)
+                elif wd in self._file_watches:
+                    path = self._file_watches[wd]
+                    changed.add(path)
+                    if mask & IN_IGNORED: # the file went away
+                        del self._file_watches[wd]
+                        if self._watches.get(path) == wd:
+                            del self._watches[path]
+                elif wd in self._dir_watches and name:
+                    path = os.path.join(self._dir_watches[wd],
+                                        os.fsdecode(name))
+                    if path in self._paths:
+                        changed.add(path)
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            self._watch_file(path) # a new file by that name
+    def wait(self, timeout=None):
+        """Waits until at least one file has changed (or until timeout
+        seconds have passed) and returns the set of changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while 1:
+            changed = self.check()
+            if changed:
+                return changed
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+            select.select([self._fd], [], [], remaining)
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+    def __del__(self):
+        try:
+            self.close()
+        except (AttributeError, OSError):
+            pass
+
+class _SharedWatcher:
+    """One watcher shared by the TailedFiles using select() without
+    their own watcher, so hundreds of them don't need hundreds of
+    inotify instances (fs.inotify.max_user_instances is usually 128).
+    One thread at a time waits on the real watcher and hands the changes
+    it sees to the others."""
+    def __init__(self):
+        self._watcher = None
+        self._lock = threading.Lock()
+        self._changes = threading.Condition(self._lock)
+        self._users = {} # path : number of TailedFiles watching it
+        self._changed = set() # paths changed which nobody has seen yet
+        self._waiting = False # whether a thread is in _watcher.wait()
+    def add(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = make_watcher()
+            if not self._users.get(path):
+                self._watcher.add(path)
+            self._users[path] = self._users.get(path, 0) + 1
+    def remove(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._users[path] -= 1
+            if not self._users[path]:
+                del self._users[path]
+                self._changed.discard(path)
+                self._watcher.remove(path)
+            if not self._users:
+                self._watcher.close()
+                self._watcher = None
+    def wait(self, path, timeout=None):
+        """Waits until path changes or timeout seconds pass."""
+        path = os.path.abspath(path)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while 1:
+                if path in self._changed:
+                    self._changed.discard(path)
+                    return
+                if deadline is None:
+                    remaining = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                if self._waiting: # someone else is watching for us
+                    self._changes.wait(remaining)
+                    continue
+                self._waiting = True
+                watcher = self._watcher
+                self._lock.release()
+                try:
+                    changed = watcher.wait(remaining)
+                finally:
+                    self._lock.acquire()
+                    self._waiting = False
+                self._changed.update(p for p in changed if p in self._users)
+                # wake the others, so they see their changes or one of
+                # them takes over waiting
+                self._changes.notify_all()
+
+_shared_watcher = _SharedWatcher()
 
-__all__ = ['TailedFile', 'TailInterface', 'Tailer']
+def make_watcher(backend='auto', interval=0.1):
+    """Returns an InotifyWatcher if backend is 'inotify' or 'auto' (and
+    inotify works here), otherwise a PollingWatcher checking every
+    interval seconds."""
+    if backend in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher()
+        except OSError:
+            if backend == 'inotify':
+                raise
+    elif backend != 'poll':
+        raise ValueError("Unknown backend: %r" % backend)
+    return PollingWatcher(interval)
 
 class TailedFile:
     """An object representing an object being tailed and it's current state.
     initial is the offset in the file where we should start.  Setting it to
-    None will start us from the end."""
-    def __init__(self, filename, initial=None, line_buffered=True):
+    None will start us from the end.
+
+    The file's inode and size are checked on every poll(): if the file
+    is replaced (e.g. by log rotation), we finish reading the old file
+    and then reopen the new one from the start; if it's truncated, we
+    start again from the beginning.  Text is bytes."""
+    def __init__(self, filename, initial=None, line_buffered=True,
+                 chunksize=65536, checkpoint=None, checkpoint_interval=1.0):
         """Filename is the name of the file to watch.  initial is the
         size where where should start watching from.  Omitting initial
         will result in watching changes from the end of the file.
         Like Python lists, if initial is less than 0, we will count from
         the current end of the file.  If line_buffered is True, we will
-        buffer new bits until we see a newline at the end of a line."""
-        self.file = open(filename, 'rb')
+        buffer new bits until we see a newline at the end of a line.
+        By default, poll() reads at most chunksize bytes at a time.
+
+        If checkpoint is the name of a file, our offset is saved there
+        (at most every checkpoint_interval seconds, and by close()) and
+        restored from it instead of using initial.  If the file has been
+        replaced since then (a different inode), it's read from the
+        start.  Several TailedFiles can share a
+        checkpoint file."""
         self.filename = filename
-        if initial is None:
-            self.offset = os.path.getsize(filename)
-        else:
-            if initial < 0:
-                self.offset = os.path.getsize(filename) - initial
-            else:
-                self.offset = initial
-        self.size = self.offset
         self.line_buffered = line_buffered
-        self._partial_lines = ''
+        self.chunksize = chunksize
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = 0
+        self._partial_lines = b''
+        self._selecting = False # whether we're using _shared_watcher
+        self._open()
+        saved = self._load_checkpoint()
+        if saved is not None:
+            self.offset = saved
+        elif initial is None:
+            self.offset = self.size
+        elif initial < 0:
+            self.offset = max(self.size + initial, 0)
+        else:
+            self.offset = initial
+        if self.offset > self.size: # truncated while we weren't looking
+            self.offset = 0
+    def _open(self):
+        self.file = open(self.filename, 'rb', buffering=0)
+        st = os.fstat(self.file.fileno())
+        self.inode = (st.st_dev, st.st_ino)
+        self.size = st.st_size
+    def close(self):
+        """Stop tailing: saves the checkpoint (if any) and closes the file."""
+        if self.checkpoint:
+            self.save_checkpoint()
+        if self._selecting:
+            _shared_watcher.remove(self.filename)
+            self._selecting = False
+        self.file.close()
     def __len__(self):
         'Returns the size of the file'
         return self.size
     def __str__(self):
         'Returns the filename of the file'
         return self.filename
-    def seek_to_last_newline(self, step=10, newline='\n'):
-        """Try to find the beginning of the current line"""
-        self._partial_lines = ''
+
+    def _load_checkpoint(self):
+        """Returns our saved offset, or None if there isn't one for this
+        file."""
+        if not self.checkpoint:
+            return None
+        try:
+            with open(self.checkpoint) as f:
+                saved = json.load(f).get(os.path.abspath(self.filename))
+        except (OSError, ValueError):
+            return None
+        if saved is None:
+            return None
+        if tuple(saved['inode']) != self.inode:
+            return 0 # rotated since then, so this file is all new
+        if not 0 <= saved['offset'] <= self.size:
+            return 0 # truncated since then (or a bad checkpoint)
+        return saved['offset']
+    def save_checkpoint(self):
+        """Write our offset to the checkpoint file.  Partial lines we're
+        holding back aren't counted as read, so they'll be read again
+        after a restart."""
+        try:
+            with open(self.checkpoint) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state[os.path.abspath(self.filename)] = dict(inode=self.inode,
+            offset=max(self.offset - len(self._partial_lines), 0))
+        temp = self.checkpoint + '.tmp%d' % os.getpid()
+        with open(temp, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp, self.checkpoint) # atomic, so never half written
+        self._last_checkpoint = time.monotonic()
+
+    def seek_to_last_newline(self, step=65536, newline=b'\n'):
+        """Try to find the beginning of the current line: moves our
+        offset back to just after the last newline before it (or to the
+        start of the file), reading backwards step bytes at a time."""
+        self._partial_lines = b''
+        end = self.offset
+        while end > 0:
+            start = max(end - step, 0)
+            self.file.seek(start)
+            block = self.file.read(end - start)
+            pos = block.rfind(newline)
+            if pos != -1:
+                self.offset = start + pos + len(newline)
+                return
+            # keep enough overlap to find a newline spanning blocks
+            end = start + len(newline) - 1 if start else 0
+        self.offset = 0
+
+    def _read(self, limit, pieces):
+        """Read up to limit bytes (or everything, if limit < 0) from our
+        offset to the current end of the file, at most chunksize bytes
+        per read.  Returns the number of bytes read."""
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size < self.offset: # truncated
+            self.offset = 0
+            self._partial_lines = b''
+        total = 0
         self.file.seek(self.offset)
-        while 1:
-            self.file.seek(-step, 1) # move N bytes back
-            last_bit =  self.file.read(step)
-            if newline in last_bit:
-                pos = last_bit.find(newline)
-                diff = step - pos
-                self.file.seek(-diff, 1)
-                self.size = self.file.tell()
-                self.offset = self.file.tell()
+        while self.offset < self.size and (limit < 0 or total < limit):
+            amount = min(self.chunksize, self.size - self.offset)
+            if limit >= 0:
+                amount = min(amount, limit - total)
+            data = self.file.read(amount) # unbuffered, so one read()
+            if not data:
                 break
-            self.file.seek(-step, 1) # move N bytes back (again since we read)
-
-    def poll(self, read_amount=-1):
+            pieces.append(data)
+            self.offset += len(data)
+            total += len(data)
+        return total
+    def _rotated(self):
+        """Returns whether filename now names a different file."""
+        try:
+            st = os.stat(self.filename)
+        except OSError: # in the middle of being rotated
+            return False
+        return (st.st_dev, st.st_ino) != self.inode
+    def unread(self):
+        """Returns whether there's text which poll() hasn't returned yet
+        (as of the last poll())."""
+        return self.offset < self.size or self._rotated()
+    def poll(self, read_amount=None):
         """Returns a string of the new text in the file if there is any.
-        If there isn't, it returns None.  If the file shrinks (for
-        whatever reason), it will start watching from the new end of
-        the file and return None."""
-        self.size = os.path.getsize(self.filename)
-        if self.size > self.offset:
-            self.file.seek(self.offset)
-            s = self.file.read(read_amount)
-            self.offset = self.size
+        If there isn't, it returns None.  At most read_amount bytes
+        (chunksize if it's None, everything if it's negative) are read;
+        the rest is returned by later calls (see unread()).  If the file
+        shrinks (for whatever reason), it is read again from the
+        beginning, and if it has been replaced, we switch to the new
+        file after reading the rest of the old one."""
+        if read_amount is None:
+            read_amount = self.chunksize
+        pieces = []
+        count = self._read(read_amount, pieces)
+        if self.offset >= self.size and self._rotated() and \
+           (read_amount < 0 or count < read_amount):
+            if self._partial_lines:
+                # the old file's last line will never be finished, so
+                # end it here rather than gluing it onto the new file
+                pieces.append(b'\n')
+            self.file.close()
+            self._open()
+            self.offset = 0
+            if read_amount >= 0:
+                read_amount -= count
+            if read_amount:
+                self._read(read_amount, pieces)
+        if not pieces:
+            return None
+        if len(pieces) == 1:
+            s = pieces[0]
+        else:
+            s = b''.join(pieces)
 
-            if self.line_buffered:
-                s = self._partial_lines + s
-                if s.endswith('\n'):
-                    self._partial_lines = ''
-                else:
-                    # buffer the partial line
-                    lines = s.splitlines()
-                    if len(lines) > 1:
-                        s = '\n'.join(lines[:-1]) + '\n'
-                        self._partial_lines = lines[-1]
-                    else:
-                        self._partial_lines = s
-                        s = None
-
-            return s
-        # if file shrinks, we will adjust to the new size
-        if self.size < self.offset:
-            self.offset = self.size
-        return None
-    def select(self, read_amount=-1, timeout=None):
-        """Uses select() on the file instead of busy-waiting.  This has
-        the same semantics as poll() when timeout is a positive integer
-        -- it will return None if there are no new changes.  If timeout
-        is None, we will quietly wait until new data arrives."""
-        r, w, e = select.select([self.file.fileno()], [], [], timeout)
-        t = self.file.read()
-        return self.poll(read_amount)
+        if self.line_buffered:
+            s = self._partial_lines + s
+            end = s.rfind(b'\n') + 1
+            # buffer the partial line
+            self._partial_lines = s[end:]
+            s = s[:end] or None
+
+        if self.checkpoint and time.monotonic() - self._last_checkpoint >= \
+           self.checkpoint_interval:
+            self.save_checkpoint()
+        return s
+    def select(self, read_amount=None, timeout=None, watcher=None):
+        """Waits for the file to change instead of busy-waiting (select()
+        on a regular file always says it's ready, so we use a watcher
+        from make_watcher() instead).  This has the same semantics as
+        poll() when timeout is a positive number -- it will return None
+        if there are no new changes.  If timeout is None, we will
+        quietly wait until new data arrives.
+
+        By default, all TailedFiles share one watcher (released by
+        close()), which can be used from several threads.  If watcher
+        is given, its changes are consumed by this call, so it shouldn't
+        be shared between threads."""
+        if watcher is None:
+            if not self._selecting:
+                _shared_watcher.add(self.filename)
+                self._selecting = True
+            wait = lambda timeout: _shared_watcher.wait(self.filename,
+                                                        timeout)
+        else:
+            wait = watcher.wait
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while 1:
+            s = self.poll(read_amount)
+            if s:
+                return s
+            if self.unread(): # a long partial line
+                continue
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            wait(remaining)
 
 class TailInterface:
     """An interface for file watching."""
@@ -139,11 +589,36 @@ class Tailer(TailInterface):
     def __init__(self, *files, **kw):
         """Given a list of files and some keyword arguments, constructs
         an object which will watch the files for additions.  The optional
-        keyword 'interval' affects the frequency at which pollloop()
-        will check the files.  Keywords arguments will be passed along
-        to the TailedFiles."""
-        self.interval = kw.get('interval', 0.1)
+        keyword 'backend' picks how pollloop() waits for changes:
+        'inotify', 'poll' or 'auto' (inotify if it's available).  When
+        polling, 'interval' is how often pollloop() will check the
+        files.  Other keyword arguments will be passed along to the
+        TailedFiles."""
+        self.interval = kw.pop('interval', 0.1)
+        self.backend = kw.pop('backend', 'auto')
         self.files = [TailedFile(f, **kw) for f in files]
+        self._watcher = None
+    def add(self, filename, **kw):
+        """Start tailing another file (keyword arguments are passed to
+        its TailedFile).  Can be called while pollloop() or stream() are
+        running.  Returns the new TailedFile."""
+        tailed = TailedFile(filename, **kw)
+        self.files.append(tailed)
+        if self._watcher is not None:
+            self._watcher.add(filename)
+        return tailed
+    def remove(self, filename):
+        """Stop tailing a file (given its name or TailedFile)."""
+        for tailed in self.files:
+            if tailed is filename or tailed.filename == filename:
+                break
+        else:
+            raise ValueError("Not tailing %r" % filename)
+        self.files.remove(tailed)
+        tailed.close()
+        if self._watcher is not None and \
+           tailed.filename not in [f.filename for f in self.files]:
+            self._watcher.remove(tailed.filename)
     def poll(self):
         """If any files have grown, return a tuple containing the
         filename and new text.  If no files have changed, we return None.
@@ -166,16 +641,115 @@ class Tailer(TailInterface):
             if s:
                 changes.append((f, s))
         return changes
+    def close(self):
+        """Stop tailing all files (saving their checkpoints, if any)."""
+        for f in self.files:
+            f.close()
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+    def watcher(self):
+        """Returns the watcher (see make_watcher()) for our files."""
+        if self._watcher is None:
+            self._watcher = make_watcher(self.backend, self.interval)
+            for f in self.files:
+                self._watcher.add(f.filename)
+        return self._watcher
     def pollloop(self, callback):
-        """Continously watches the files for changes, sleeping for
-        'interval' amount of seconds in between (see __init__).  If there
-        are any changes, it will call the callback with two arguments:
-        the filename and new text."""
+        """Continously watches the files for changes, sleeping until
+        one changes (or, when polling, for 'interval' amount of seconds
+        in between -- see __init__).  If there are any changes, it will
+        call the callback with two arguments: the filename and new
+        text."""
+        watcher = self.watcher()
+        changed = None # check all files the first time
         while 1:
-            changes = self.multipoll()
-            for change in changes:
+            for change in self._poll_changed(changed):
                 callback(*change)
-            time.sleep(self.interval)
+            # files we haven't finished reading won't necessarily get
+            # another event, so keep reading them without waiting
+            changed = self._unread_files()
+            if changed:
+                changed |= watcher.check()
+            else:
+                changed = watcher.wait()
+
+    def _unread_files(self):
+        """Returns the set of (absolute) paths of files we haven't
+        finished reading."""
+        return set(os.path.abspath(f.filename) for f in self.files
+                   if f.unread())
+    def _poll_changed(self, changed):
+        """Returns (file, newtext) for the files in changed (a set of
+        absolute paths, or None for all of them) with new text."""
+        changes = []
+        for f in list(self.files):
+            if changed is None or os.path.abspath(f.filename) in changed:
+                s = f.poll()
+                if s:
+                    changes.append((f, s))
+        return changes
+    async def _wait(self, watcher):
+        """Asynchronous version of watcher.wait()."""
+        fd = watcher.fileno()
+        if fd is None: # polling
+            while 1:
+                await asyncio.sleep(self.interval)
+                changed = watcher.check()
+                if changed:
+                    return changed
+        loop = asyncio.get_running_loop()
+        while 1:
+            changed = watcher.check()
+            if changed:
+                return changed
+            # only listen while we're waiting: the descriptor stays
+            # readable until we read it, which would make the loop spin
+            # while our consumer is busy
+            readable = loop.create_future()
+            loop.add_reader(fd, lambda: readable.done() or
+                                        readable.set_result(None))
+            try:
+                await readable
+            finally:
+                loop.remove_reader(fd)
+    async def stream(self):
+        """Asynchronous generator yielding (file, newtext) as the files
+        grow:
+
+            async for tailed, text in tailer.stream():
+                ...
+
+        Files are only read when you ask for the next change, so a slow
+        consumer holds back reading (rather than buffering up changes
+        in memory), and other tasks run while we wait.  Files can be
+        added or removed with add() and remove() while streaming."""
+        watcher = self.watcher()
+        changed = None # check all files the first time
+        while 1:
+            for change in self._poll_changed(changed):
+                yield change
+            changed = self._unread_files()
+            if changed:
+                changed |= watcher.check()
+            else:
+                changed = await self._wait(watcher)
+    async def lines(self):
+        """Like stream(), but yields (file, line) for each complete line
+        (including its newline).  Partial lines are held back until
+        they're finished."""
+        partial = {} # TailedFile : incomplete last line
+        async for tailed, text in self.stream():
+            text = partial.pop(tailed, b'') + text
+            start = 0
+            while 1: # only b'\n' ends lines (splitlines() also splits on \r)
+                end = text.find(b'\n', start) + 1
+                if not end:
+                    break
+                yield tailed, text[start:end]
+                start = end
+            if start < len(text):
+                partial[tailed] = text[start:]
 
 if __name__ == '__main__':
     print("Tailing %s:" % (', '.join(sys.argv[1:])))
@@ -1,44 +1,452 @@
-"""Wraps twisted.python.threadpool in a way that makes more sense to me."""
-import time, random
-from twisted.python import threadpool, threadable
+"""Runs jobs in a pool of worker threads (or processes) using
+concurrent.futures in a way that makes more sense to me.
+
+Example:
+
+>>> def add(a, b):
+...     return a + b
+>>> tj = ThreadedJobs(add, [(1, 2), (3, 4)], debug=False)
+>>> tj.start()
+[3, 7]
+"""
+import time, random, threading, queue, math, traceback
+from collections import deque, namedtuple
+from concurrent import futures
+from itertools import islice
+
+__all__ = ['ThreadedJobs', 'AutoscalingThreadPoolExecutor', 'JobStats',
+           'JobTiming']
+
+# all times are in seconds.  wait is the time between submission and
+# the job starting in a worker, wall is how long it ran, cpu is the CPU
+# time its thread used while running.
+JobTiming = namedtuple('JobTiming', 'submitted started finished wait wall cpu')
+
+class _RemoteTraceback(Exception):
+    """Carries the formatted traceback of an exception raised in a
+    worker process (like concurrent.futures.process does)."""
+    def __str__(self):
+        return self.args[0]
+
+def _run(func, args, debug, submitted):
+    """Runs a job in a worker.  This is a module-level function so that
+    it can be sent to worker processes.  Returns (result, exception,
+    traceback text, JobTiming) so that failed jobs are timed too."""
+    if debug:
+        print("Starting", args)
+    started = time.time()
+    cpu_started = time.thread_time()
+    result = error = tb = None
+    try:
+        result = func(*args)
+    except Exception as exc:
+        error = exc
+        tb = traceback.format_exc()
+    finished = time.time()
+    timing = JobTiming(submitted, started, finished, started - submitted,
+                       finished - started, time.thread_time() - cpu_started)
+    return result, error, tb, timing
+
+class JobStats:
+    """Collects JobTimings.  Totals cover every job; latency percentiles
+    and throughput cover the last window jobs."""
+    def __init__(self, workers, window=1000):
+        self.workers = workers
+        self.recent = deque(maxlen=window)
+        self.first_submitted = None
+        self.finished = self.failed = 0
+        self.total_wall = self.total_cpu = self.total_wait = 0.0
+        self._lock = threading.Lock()
+    def record(self, timing, failed=False):
+        with self._lock:
+            self.recent.append(timing)
+            if self.first_submitted is None or \
+               timing.submitted < self.first_submitted:
+                self.first_submitted = timing.submitted
+            self.finished += 1
+            if failed:
+                self.failed += 1
+            self.total_wall += timing.wall
+            self.total_cpu += timing.cpu
+            self.total_wait += timing.wait
+    def snapshot(self, now=None):
+        """Returns a dictionary of statistics:
+        jobs_finished, jobs_failed: counts
+        mean_wall, mean_cpu, mean_wait: averages over all jobs
+        utilization: fraction of the workers' time spent running jobs
+        throughput: jobs finished per second, over the recent jobs
+        latency_p50, latency_p95, latency_p99: wall time percentiles
+        wait_p50, wait_p95: queue wait percentiles (recent jobs)"""
+        from AIMA import quantile
+        now = now or time.time()
+        with self._lock:
+            recent = list(self.recent)
+            stats = dict(jobs_finished=self.finished,
+                         jobs_failed=self.failed)
+            if not self.finished:
+                return stats
+            stats.update(mean_wall=self.total_wall / self.finished,
+                         mean_cpu=self.total_cpu / self.finished,
+                         mean_wait=self.total_wait / self.finished)
+            elapsed = now - self.first_submitted
+            if elapsed > 0:
+                stats['utilization'] = min(self.total_wall /
+                                           (elapsed * self.workers), 1.0)
+        span = now - min(timing.submitted for timing in recent)
+        if span > 0:
+            stats['throughput'] = len(recent) / span
+        walls = [timing.wall for timing in recent]
+        waits = [timing.wait for timing in recent]
+        for q in (50, 95, 99):
+            stats['latency_p%d' % q] = quantile(walls, q / 100.0)
+        for q in (50, 95):
+            stats['wait_p%d' % q] = quantile(waits, q / 100.0)
+        return stats
+
+class _JobFuture(futures.Future):
+    """The Future returned by ThreadedJobs.addjob().  It exists before
+    the job is handed to the executor and follows the executor's Future
+    afterwards, so cancelling it works at any time."""
+    def __init__(self):
+        futures.Future.__init__(self)
+        self._executor_future = None
+    def cancel(self):
+        if self._executor_future is not None:
+            return self._executor_future.cancel()
+        return futures.Future.cancel(self)
+    def running(self):
+        if self._executor_future is not None:
+            return self._executor_future.running()
+        return False
+    def _cancelled_before_submission(self):
+        """If we were cancelled, let waiters know and return True."""
+        if self.cancelled():
+            self.set_running_or_notify_cancel()
+            return True
+        return False
+    def _follow(self, executor_future, unwrap):
+        """Mirror executor_future's outcome.  unwrap turns the return
+        value of _run into (result, exception)."""
+        self._executor_future = executor_future
+        def copy_outcome(done):
+            if done.cancelled():
+                futures.Future.cancel(self)
+                self.set_running_or_notify_cancel()
+                return
+            if done.exception() is not None:
+                result, error = None, done.exception()
+            else:
+                result, error = unwrap(done.result())
+            if error is not None:
+                self.set_exception(error)
+            else:
+                self.set_result(result)
+        executor_future.add_done_callback(copy_outcome)
+
+class AutoscalingThreadPoolExecutor(futures.Executor):
+    """A thread pool which grows and shrinks between min_workers and
+    max_workers.  After each submission and each finished task, it
+    estimates how long the queued tasks would wait (queue depth times
+    the average task latency, divided by the number of workers) and
+    adds workers while that is over target_wait seconds.  Workers which
+    sit idle for idle_timeout seconds exit (down to min_workers)."""
+    def __init__(self, min_workers=1, max_workers=32, idle_timeout=5.0,
+                 target_wait=0.1):
+        assert 0 <= min_workers <= max_workers and max_workers > 0
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self.target_wait = target_wait
+        self.avg_latency = None # exponentially weighted, in seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._idle = 0
+        self._shutdown = False
+        for i in range(min_workers):
+            self._spawn()
+    def num_workers(self):
+        with self._lock:
+            return len(self._threads)
+    def _spawn(self):
+        """Must be called with the lock held (or from __init__)."""
+        thread = threading.Thread(target=self._work, daemon=True)
+        self._threads.add(thread)
+        thread.start()
+    def _adjust(self):
+        with self._lock:
+            if self._shutdown:
+                return
+            depth = self._queue.qsize()
+            workers = len(self._threads)
+            if workers >= self.max_workers or depth <= self._idle:
+                return
+            if self.avg_latency is None or not workers:
+                wanted = depth - self._idle
+            else:
+                expected_wait = depth * self.avg_latency / workers
+                wanted = int(math.ceil(expected_wait / self.target_wait))
+                wanted = min(wanted, depth - self._idle)
+            for i in range(min(wanted, self.max_workers - workers)):
+                self._spawn()
+    def _work(self):
+        me = threading.current_thread()
+        while 1:
+            with self._lock:
+                self._idle += 1
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._idle -= 1
+                    if len(self._threads) > self.min_workers:
+                        self._threads.discard(me)
+                        return
+                continue
+            with self._lock:
+                self._idle -= 1
+            if item is None: # shutdown
+                with self._lock:
+                    self._threads.discard(me)
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.time()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+            latency = time.time() - started
+            with self._lock:
+                if self.avg_latency is None:
+                    self.avg_latency = latency
+                else:
+                    self.avg_latency += 0.2 * (latency - self.avg_latency)
+            self._adjust()
+    def submit(self, fn, *args, **kwargs):
+        if self._shutdown:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        future = futures.Future()
+        self._queue.put((future, fn, args, kwargs))
+        self._adjust()
+        return future
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        if cancel_futures:
+            while 1:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
 
 class ThreadedJobs:
-    def __init__(self, func=None, arglistlist=None, workers=5, debug=True):
-        """arglistlist is a list of a list of args"""
+    def __init__(self, func=None, arglistlist=None, workers=5, debug=True,
+                 executor='thread', max_pending=None, autoscale=False,
+                 reporter=None, report_interval=10.0):
+        """arglistlist is a list of a list of args.  executor is
+        'thread' or 'process' (jobs and their arguments must then be
+        picklable) or an existing concurrent.futures.Executor, which
+        won't be shut down by start().
+
+        If max_pending is given, jobs start running as soon as they are
+        added and addjob() blocks while max_pending jobs are unfinished,
+        so producers can't run arbitrarily far ahead of the workers.
+        If autoscale is True (thread executor only), workers is the
+        maximum pool size and threads are added and removed based on
+        queue depth and task latency (see AutoscalingThreadPoolExecutor).
+
+        Every job is timed (see stats()).  If reporter is given, it is
+        called with stats() every report_interval seconds while the
+        pool is running, and once more when it shuts down."""
         self.jobsfinished = 0
         self.jobstodo = 0
         self.debug = debug
-        self.tp = threadpool.ThreadPool(workers, workers)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.autoscale = autoscale
+        if max_pending is not None:
+            self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor_kind = executor
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = [] # (future, func, args) not yet submitted
+        self._futures = []
+        self._stats = JobStats(workers)
+        self.reporter = reporter
+        self.report_interval = report_interval
+        self._reporter_thread = None
+        self._stop_reporting = threading.Event()
         for arglist in arglistlist or []:
             self.addjob(func, *arglist)
 
-    def start(self):
-        self.tp.start()
-        while self.jobsfinished < self.getjobstodo():
-            time.sleep(0.1)
-        self.tp.stop()
+    def _get_executor(self):
+        if self._executor is None:
+            kind = self._executor_kind
+            if kind == 'thread' and self.autoscale:
+                self._executor = AutoscalingThreadPoolExecutor(
+                    max_workers=self.workers)
+            elif kind == 'thread':
+                self._executor = futures.ThreadPoolExecutor(self.workers)
+            elif kind == 'process':
+                self._executor = futures.ProcessPoolExecutor(self.workers)
+            elif isinstance(kind, futures.Executor):
+                self._executor = kind
+            else:
+                raise ValueError("Unknown executor: %r" % kind)
+            if self.reporter is not None:
+                self._stop_reporting.clear()
+                self._reporter_thread = threading.Thread(
+                    target=self._report_periodically, daemon=True)
+                self._reporter_thread.start()
+        return self._executor
+    def _report_periodically(self):
+        while not self._stop_reporting.wait(self.report_interval):
+            self.reporter(self.stats())
+    def _submit(self, executor, func, args, debug):
+        return executor.submit(_run, func, args, debug, time.time())
+    def _unwrap(self, outcome):
+        """Record the timing from a _run outcome and return (result,
+        exception)."""
+        result, error, tb, timing = outcome
+        self._stats.record(timing, failed=error is not None)
+        if error is not None and error.__traceback__ is None and tb:
+            error.__cause__ = _RemoteTraceback(tb) # from another process
+        return result, error
 
-    def _run(self, func, *args):
-        if self.debug:
-            print("Starting", args)
-        func(*args)
-        self.finished(args)
+    def stats(self):
+        """Returns a snapshot of job statistics (see JobStats.snapshot)
+        along with jobs_pending (added but unfinished jobs) and, for
+        autoscaling pools, current_workers."""
+        stats = self._stats.snapshot()
+        with self._lock:
+            stats['jobs_pending'] = len([future for future in self._futures
+                                         if not future.done()])
+        if isinstance(self._executor, AutoscalingThreadPoolExecutor):
+            stats['current_workers'] = self._executor.num_workers()
+        return stats
+    def _submit_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        executor = self._get_executor()
+        for future, func, args in pending:
+            if future._cancelled_before_submission():
+                continue
+            future.add_done_callback(self._job_done)
+            future._follow(self._submit(executor, func, args, self.debug),
+                           self._unwrap)
+
+    def start(self, timeout=None):
+        """Run all jobs and wait (without polling) until they are done
+        or cancelled.  Returns their results in the order they were
+        added (cancelled jobs are left out).  If any job raised an
+        exception, the first one (in that order) is raised here after
+        all the jobs have finished."""
+        self._submit_pending()
+        done, not_done = futures.wait(self._futures, timeout=timeout)
+        if not_done:
+            raise futures.TimeoutError("%d jobs still running" %
+                                       len(not_done))
+        self.shutdown()
+        results = []
+        for future in self._futures:
+            if future.cancelled():
+                continue
+            results.append(future.result())
+        return results
+
+    def as_completed(self, timeout=None):
+        """Run all jobs, yielding their Futures as they finish."""
+        self._submit_pending()
+        return futures.as_completed(self._futures, timeout=timeout)
+
+    def cancel(self):
+        """Cancel all jobs which haven't started running yet.  Returns
+        the number cancelled."""
+        return len([future for future in self._futures if future.cancel()])
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool (start() does this for you).  Executors
+        passed in by the caller are left running."""
+        if self._executor is not None and \
+           not isinstance(self._executor_kind, futures.Executor):
+            self._executor.shutdown(wait=wait)
+        if self._reporter_thread is not None:
+            self._stop_reporting.set()
+            self._reporter_thread.join()
+            self._reporter_thread = None
+            self.reporter(self.stats())
+        self._executor = None
+
+    def _job_done(self, future):
+        if not future.cancelled():
+            self.finished(future._args)
 
     def finished(self, args):
         if self.debug:
             print("Finished with", args)
-        self.jobsfinished += 1
-    
+        with self._lock:
+            self.jobsfinished += 1
+
     def getjobstodo(self):
         return self.jobstodo
 
     def addjob(self, func, *arglist):
-        self.jobstodo += 1
-        self.tp.callInThread(self._run, func, *arglist)
-
-    synchronized = ["finished", "getjobstodo", "addjob"]
+        """Add a job: func(*arglist).  Returns a Future for its result.
+        Jobs added before start() run when it is called; later jobs
+        start right away."""
+        future = _JobFuture()
+        future._args = arglist
+        if self.max_pending is not None:
+            self._slots.acquire()
+            future.add_done_callback(lambda done: self._slots.release())
+        with self._lock:
+            self.jobstodo += 1
+            self._futures.append(future)
+            self._pending.append((future, func, arglist))
+            started = self._executor is not None
+        if started or self.max_pending is not None:
+            self._submit_pending()
+        return future
 
-threadable.synchronize(ThreadedJobs)
+    def map_unordered(self, func, iterable, max_pending=None):
+        """Yields func(item) for each item of iterable, in the order the
+        results are ready.  Items are read from iterable lazily: at most
+        max_pending (default: self.max_pending, or twice the number of
+        workers) calls are in flight at once.  Exceptions from func are
+        raised when their result would have been yielded.  These calls
+        aren't jobs (start() doesn't wait for them)."""
+        max_pending = max_pending or self.max_pending or 2 * self.workers
+        executor = self._get_executor()
+        iterable = iter(iterable)
+        in_flight = set()
+        def fill():
+            for item in islice(iterable, max_pending - len(in_flight)):
+                in_flight.add(self._submit(executor, func, (item,), False))
+        fill()
+        while in_flight:
+            done, not_done = futures.wait(in_flight,
+                return_when=futures.FIRST_COMPLETED)
+            in_flight.difference_update(done)
+            fill()
+            for future in done:
+                result, error = self._unwrap(future.result())
+                if error is not None:
+                    raise error
+                yield result
 
 if __name__ == "__main__":
     def sleeper(amount, bogusarg):
@@ -9,26 +9,23 @@ Description:
 For functions which are called often, particulary recursive functions
 or functions which are intensive to calculate, memoizing (cacheing)
 the return values can dramatically improve performance.
+
+Modified by dmcc: Memoize is now a waterworks.Caching.MemoizedFunction,
+so it can be bounded (maxsize, ttl), is thread-safe and handles keyword
+arguments.
 """
+from waterworks.Caching import MemoizedFunction
 
-class Memoize:
+class Memoize(MemoizedFunction):
     """Memoize(fn) - an instance which acts like fn but memoizes its arguments
        Will only work on functions with non-mutable arguments
     """
-    def __init__(self, fn):
-        self.fn = fn
-        self.memo = {}
-    def __call__(self, *args):
-        if args not in self.memo:
-            self.memo[args] = self.fn(*args)
-        return self.memo[args]
-    def clear(self):
-        """Forget all memoized results."""
-        self.memo.clear()
+    def __init__(self, fn, maxsize=None, ttl=None):
+        MemoizedFunction.__init__(self, fn, maxsize=maxsize, ttl=ttl)
+        self.memo = self.cache
 
 # this came from a different recipe
 # http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/325205
 # TODO: incorporate more of their code (ImmutableDict, e.g.)
-import types
 def cachedmethod(function):
-    return types.MethodType(Memoize(function), None)
+    return Memoize(function)
@@ -11,54 +11,95 @@ Version no: 1.0
 Category: Files
 
 Description:
-Yet another way to read a file line by line, starting at the end. 
+Yet another way to read a file line by line, starting at the end.
 
 Modified by dmcc: put __init__ at top, testing code in __main__ and
-add __iter__ method.
+add __iter__ method.  Later ported to Python 3 (bytes buffers, since
+text files can't seek backwards) and made to read 64K blocks without
+copying or rescanning the buffer for every line.
 """
 
-import os
-import string
+import io
 
 class BackwardsReader:
-    """Read a file line by line, backwards"""
-    BLKSIZE = 4096
-    def __init__(self, file):
+    """Read a file line by line, backwards.  Lines are returned as they
+    appear in the file (the last one may be missing its newline).  Give
+    it a binary file to get bytes or a text file to get strings.
+
+    >>> import io
+    >>> list(BackwardsReader(io.BytesIO(b'one\\ntwo\\nthree')))
+    [b'three', b'two\\n', b'one\\n']
+    """
+    BLKSIZE = 65536
+    def __init__(self, file, blksize=None):
+        self.encoding = None
+        if isinstance(file, io.TextIOBase):
+            self.encoding = file.encoding
+            self.errors = file.errors
+            self.textfile = file # closing it would close the buffer too
+            file = file.buffer
         self.file = file
-        self.buf = ""
-        self.file.seek(0, 2)
+        self.blksize = blksize or self.BLKSIZE
+        self.block = b"" # the most recently read block...
+        self._end = 0 # ...of which block[:self._end] hasn't been returned
+        self._pieces = [] # later parts of a line longer than a block
+        self._pos = self.file.seek(0, 2) # block starts here in the file
+        self._newline = b"" # ending of the line at the end of block[:_end]
+        self._done = False
+        if self._pos:
+            self.file.seek(-1, 2)
+            if self.file.read(1) == b"\n":
+                self._newline = b"\n"
+                self._pos -= 1
+    def _decode(self, line):
+        if self.encoding is None:
+            return line
+        return line.decode(self.encoding, self.errors)
+    def _line(self, start):
+        """Returns the line starting at block[start] and ending at _end
+        (plus any pieces from later blocks)."""
+        line = self.block[start:self._end]
+        if self._pieces:
+            self._pieces.append(line)
+            line = b"".join(reversed(self._pieces))
+            self._pieces = []
+        return self._decode(line + self._newline)
     def readline(self):
         while 1:
-            newline_pos = string.rfind(self.buf, "\n")
+            newline_pos = self.block.rfind(b"\n", 0, self._end)
             if newline_pos != -1:
                 # Found a newline
-                line = self.buf[newline_pos+1:]
-                self.buf = self.buf[:newline_pos]
-                return line + "\n"
+                line = self._line(newline_pos + 1)
+                self._end = newline_pos
+                self._newline = b"\n"
+                return line
+            elif self._pos == 0:
+                # Start-of-file
+                if self._done:
+                    return self._decode(b"")
+                self._done = True
+                return self._line(0)
             else:
-                pos = self.file.tell()
-                if pos == 0:
-                    # Start-of-file
-                    return ""
-                else:
-                    # Need to fill buffer
-                    backseek = min(self.BLKSIZE, pos)
-                    self.file.seek(-backseek, 1)
-                    self.buf = self.file.read(self.BLKSIZE) + self.buf
-                    self.file.seek(-backseek, 1)
-                    if pos - backseek == 0:
-                        self.buf = "\n" + self.buf
+                # Need to fill buffer (keeping what's left of the
+                # current block for the line it ends)
+                if self._end:
+                    self._pieces.append(self.block[:self._end])
+                backseek = min(self.blksize, self._pos)
+                self._pos -= backseek
+                self.file.seek(self._pos)
+                self.block = self.file.read(backseek)
+                self._end = len(self.block)
     def __iter__(self):
         while 1:
             line = self.readline()
-            if line == "":
+            if not line:
                 break
             else:
                 yield line
 
 if __name__ == "__main__":
     # Example usage
-    br = BackwardsReader(open('bar'))
+    br = BackwardsReader(open('bar', 'rb'))
 
     while 1:
         line = br.readline()
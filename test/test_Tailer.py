@@ -0,0 +1,107 @@
+import os, json, shutil, tempfile, unittest
+import Tailer
+from Tailer import TailedFile
+
+class TestTailedFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'test.log')
+        self.checkpoint = os.path.join(self.dir, 'checkpoint.json')
+        self.write(b'', 'wb')
+        self.tailed = []
+
+    def tearDown(self):
+        for tailed in self.tailed:
+            tailed.file.close()
+        shutil.rmtree(self.dir)
+
+    def write(self, data, mode='ab'):
+        with open(self.filename, mode) as f:
+            f.write(data)
+
+    def tail(self, **kw):
+        tailed = TailedFile(self.filename, **kw)
+        self.tailed.append(tailed)
+        return tailed
+
+    def rotate(self, data):
+        os.rename(self.filename, self.filename + '.1')
+        self.write(data, 'wb')
+
+    def testlinebuffered(self):
+        tailed = self.tail()
+        self.write(b'one\ntw')
+        self.assertEqual(tailed.poll(), b'one\n')
+        self.assertEqual(tailed.poll(), None)
+        self.write(b'o\n')
+        self.assertEqual(tailed.poll(), b'two\n')
+
+    def testboundedreads(self):
+        tailed = self.tail(line_buffered=False, chunksize=4)
+        self.write(b'0123456789')
+        self.assertEqual(tailed.poll(), b'0123')
+        self.assertTrue(tailed.unread())
+        self.assertEqual(tailed.poll(read_amount=-1), b'456789')
+        self.assertFalse(tailed.unread())
+
+    def testtruncation(self):
+        tailed = self.tail()
+        self.write(b'first\n')
+        self.assertEqual(tailed.poll(), b'first\n')
+        self.write(b'new\n', 'wb')
+        self.assertEqual(tailed.poll(), b'new\n')
+
+    def testrotation(self):
+        tailed = self.tail()
+        self.write(b'old\n')
+        self.rotate(b'new\n')
+        self.assertEqual(tailed.poll(), b'old\nnew\n')
+        self.assertFalse(tailed.unread())
+
+    def testcheckpoint(self):
+        tailed = self.tail(initial=0, checkpoint=self.checkpoint)
+        self.write(b'one\ntw')
+        self.assertEqual(tailed.poll(), b'one\n')
+        tailed.close()
+        self.write(b'o\n')
+        tailed = self.tail(checkpoint=self.checkpoint)
+        self.assertEqual(tailed.poll(), b'two\n')
+
+    def testrotationpartiallinecheckpoint(self):
+        # the old file's unfinished line used to be counted against the
+        # new file's offset, saving a negative offset
+        tailed = self.tail(checkpoint=self.checkpoint)
+        self.write(b'abc')
+        self.assertEqual(tailed.poll(), None)
+        self.rotate(b'xy')
+        self.assertEqual(tailed.poll(), b'abc\n')
+        tailed.close()
+        tailed = self.tail(checkpoint=self.checkpoint)
+        self.write(b'z\n')
+        self.assertEqual(tailed.poll(), b'xyz\n')
+
+    def testbadcheckpoint(self):
+        st = os.stat(self.filename)
+        state = {os.path.abspath(self.filename):
+                 dict(inode=[st.st_dev, st.st_ino], offset=-3)}
+        with open(self.checkpoint, 'w') as f:
+            json.dump(state, f)
+        self.write(b'line\n')
+        tailed = self.tail(checkpoint=self.checkpoint)
+        self.assertEqual(tailed.poll(), b'line\n')
+
+    def testselectwatcher(self):
+        # select() shares one watcher between files and close() releases it
+        tailed = [self.tail(), TailedFile(self.filename)]
+        self.write(b'line\n')
+        for t in tailed:
+            self.assertEqual(t.select(timeout=1), b'line\n')
+            self.assertEqual(t.select(timeout=0.01), None)
+        watcher = Tailer._shared_watcher._watcher
+        self.assertIsNotNone(watcher)
+        for t in tailed:
+            t.close()
+        self.assertIsNone(Tailer._shared_watcher._watcher)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,425 @@
+"""Bounded, thread-safe memoization.
+
+memoize() is a decorator which caches a function's results by its
+arguments (positional and keyword).  Unlike the simple dictionary
+memoizers in AIMA and cookbook.Memoize, the cache can be bounded in size
+(least recently used entries are evicted first) and in time (entries
+older than ttl seconds are recomputed).  Concurrent calls with the same
+arguments only compute the result once -- the other threads wait for it.
+
+>>> @memoize(maxsize=2)
+... def square(x):
+...     return x * x
+>>> square(2), square(3), square(2), square(4)
+(4, 9, 4, 16)
+>>> square.cache_info()
+CacheInfo(hits=1, misses=3, evictions=1, maxsize=2, currsize=2)
+>>> square.clear()
+>>> square.cache_info()
+CacheInfo(hits=0, misses=0, evictions=0, maxsize=2, currsize=0)
+"""
+
+import os, sys, time, threading, types
+import hashlib, pickle, shelve, dbm
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+__all__ = ['CacheInfo', 'MemoizedFunction', 'memoize', 'make_key',
+           'stable_hash', 'ShelveCache', 'PersistentMemoizedFunction',
+           'persistent_memoize']
+
+CacheInfo = namedtuple('CacheInfo',
+                       'hits misses evictions maxsize currsize')
+
+_kwargs_marker = object()
+
+def make_key(args, kwargs):
+    """Returns a hashable key for a call with args and kwargs.  Calls
+    without keyword arguments are keyed by their argument tuple alone,
+    so caches look just like the plain dictionaries used by the older
+    memoizers."""
+    if not kwargs:
+        return args
+    return args + (_kwargs_marker,) + tuple(sorted(kwargs.items()))
+
+class _PendingCall:
+    """A result being computed by one thread which others wait for."""
+    def __init__(self):
+        self.owner = threading.current_thread()
+        self.done = threading.Event()
+        self.value = None
+        self.exception = None
+
+def _new_instance(cls):
+    return cls.__new__(cls)
+
+class MemoizedFunction:
+    """Wraps a function, caching its results.  Use memoize() to create
+    these.  The cache is available as the cache attribute (an
+    OrderedDict from keys made by make_key() to results, oldest first)."""
+    def __init__(self, fn, maxsize=None, ttl=None, timer=time.monotonic):
+        """If maxsize is not None, at most maxsize results are kept.  If
+        ttl is not None, results expire ttl seconds (according to timer)
+        after they were computed."""
+        self.fn = fn
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.cache = OrderedDict()
+        self._expirations = {} # key : time when it expires
+        self._pending = {} # key : _PendingCall
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        for attr in ('__module__', '__name__', '__qualname__', '__doc__'):
+            try:
+                setattr(self, attr, getattr(fn, attr))
+            except AttributeError:
+                pass
+        self.__wrapped__ = fn
+    def __repr__(self):
+        return "<%s of %r>" % (self.__class__.__name__, self.fn)
+    def __reduce__(self):
+        """Pickle by reference (like plain functions) when we can be
+        found under our name (i.e. we were used as a decorator), so
+        that memoized functions can be sent to other processes.
+        Otherwise (e.g. fast_f = MemoizedFunction(f)), pickle by value,
+        cache included."""
+        found = sys.modules.get(getattr(self, '__module__', None))
+        for name in getattr(self, '__qualname__', '<>').split('.'):
+            found = getattr(found, name, None)
+        if found is self:
+            return self.__qualname__
+        return (_new_instance, (self.__class__,), self.__getstate__())
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock'], state['_pending']
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._pending = {}
+    def __get__(self, obj, objtype=None):
+        """Lets MemoizedFunctions be used as methods (the instance
+        becomes part of the key)."""
+        if obj is None:
+            return self
+        return types.MethodType(self, obj)
+
+    def _lookup(self, key):
+        """Returns (True, value) for a live cache entry, otherwise
+        (False, None).  Must be called with the lock held."""
+        if key not in self.cache:
+            return False, None
+        if self.ttl is not None and self._expirations[key] <= self.timer():
+            del self.cache[key]
+            del self._expirations[key]
+            self.evictions += 1
+            return False, None
+        self.cache.move_to_end(key)
+        return True, self.cache[key]
+    def _store(self, key, value):
+        """Must be called with the lock held."""
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if self.ttl is not None:
+            self._expirations[key] = self.timer() + self.ttl
+        if self.maxsize is not None:
+            while len(self.cache) > self.maxsize:
+                oldkey, oldvalue = self.cache.popitem(last=False)
+                self._expirations.pop(oldkey, None)
+                self.evictions += 1
+
+    def _compute(self, key, args, kwargs):
+        """Called (without the lock) to produce the value for a miss."""
+        return self.fn(*args, **kwargs)
+    def __call__(self, *args, **kwargs):
+        key = make_key(args, kwargs)
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            pending = self._pending.get(key)
+            if pending is None or pending.owner is threading.current_thread():
+                # we compute it (the second case is a recursive call
+                # with the same arguments, which we can't wait for)
+                pending = mine = _PendingCall()
+                self._pending.setdefault(key, mine)
+            else:
+                mine = None
+
+        if mine is None:
+            pending.done.wait()
+            if pending.exception is not None:
+                raise pending.exception
+            return pending.value
+
+        try:
+            value = self._compute(key, args, kwargs)
+        except BaseException as exc:
+            mine.exception = exc
+            raise
+        else:
+            mine.value = value
+            with self._lock:
+                if self.maxsize != 0:
+                    self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                if self._pending.get(key) is mine:
+                    del self._pending[key]
+            mine.done.set()
+
+    def cache_info(self):
+        """Returns a CacheInfo of hit, miss and eviction statistics."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             self.maxsize, len(self.cache))
+    def clear(self):
+        """Forget all memoized results and reset the statistics."""
+        with self._lock:
+            self.cache.clear()
+            self._expirations.clear()
+            self.hits = self.misses = self.evictions = 0
+    cache_clear = clear
+
+def _slot_memoize(fn, slot):
+    """Per-instance caching: store fn's result in the slot attribute of
+    its first argument.  Like MemoizedFunction, concurrent first calls
+    on the same instance compute the result once, but calls on other
+    instances don't wait for them."""
+    lock = threading.Lock()
+    pending = {} # id(obj) : _PendingCall (obj is alive while it's here)
+    def memoized_fn(obj, *args):
+        try:
+            return getattr(obj, slot)
+        except AttributeError:
+            pass
+        key = id(obj)
+        with lock:
+            if hasattr(obj, slot):
+                return getattr(obj, slot)
+            call = pending.get(key)
+            if call is None or call.owner is threading.current_thread():
+                call = mine = _PendingCall()
+                pending.setdefault(key, mine)
+            else:
+                mine = None
+
+        if mine is None:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.value
+
+        try:
+            val = fn(obj, *args)
+        except BaseException as exc:
+            mine.exception = exc
+            raise
+        else:
+            setattr(obj, slot, val)
+            mine.value = val
+            return val
+        finally:
+            with lock:
+                if pending.get(key) is mine:
+                    del pending[key]
+            mine.done.set()
+    def clear(obj):
+        """Forget the result cached on obj."""
+        try:
+            delattr(obj, slot)
+        except AttributeError:
+            pass
+    memoized_fn.clear = clear
+    memoized_fn.__wrapped__ = fn
+    memoized_fn.__name__ = getattr(fn, '__name__', 'memoized_fn')
+    memoized_fn.__doc__ = getattr(fn, '__doc__', None)
+    return memoized_fn
+
+def memoize(fn=None, maxsize=None, ttl=None, slot=None):
+    """Memoize fn: make it remember the computed value for any argument
+    list.  Can be used directly (memoize(fn), @memoize) or with options
+    (@memoize(maxsize=1000, ttl=60)).  See MemoizedFunction for maxsize
+    and ttl.  If slot is specified, results are cached per instance
+    instead: the result is stored in that attribute of the first
+    argument (and the other arguments are ignored), so maxsize and ttl
+    can't be used with it."""
+    if slot and (maxsize is not None or ttl is not None):
+        raise ValueError("maxsize and ttl can't be used with slot.")
+    def decorator(fn):
+        if slot:
+            return _slot_memoize(fn, slot)
+        return MemoizedFunction(fn, maxsize=maxsize, ttl=ttl)
+    if fn is None:
+        return decorator
+    return decorator(fn)
+
+def stable_hash(obj):
+    """Returns a hex digest of obj which is the same across processes
+    and restarts (unlike hash()), as long as obj pickles the same way.
+    Beware that sets and dicts pickle in iteration order."""
+    return hashlib.sha1(pickle.dumps(obj, protocol=2)).hexdigest()
+
+class ShelveCache:
+    """A shelve file which can be shared between processes.  Every
+    operation opens the shelve under a lock (waterworks.Files.lockfile on
+    filename + '.lock') and closes it afterwards, so readers never see a
+    half-written database.  Like IntShelve.WriteOnDemandShelve, reads
+    open the shelve read-only and only writes open it for writing.
+
+    Each entry is stored twice: 'v' + key holds the value and 't' + key
+    holds the time it was stored; 'n' holds the number of entries.  If
+    maxsize is given, once there are a quarter more entries than that,
+    the oldest are evicted in one batch (only the small timestamp
+    entries are read to decide which), so most writes don't have to
+    look at the other entries.  Since dbm.dumb files never shrink, they
+    are rewritten after each batch."""
+    def __init__(self, filename, maxsize=None, timer=time.time):
+        self._filename = filename
+        self._lockfilename = filename + '.lock'
+        self.maxsize = maxsize
+        self.timer = timer
+
+    @contextmanager
+    def _opened(self, write=False):
+        from waterworks.Files import lockfile, unlockfile
+        with open(self._lockfilename, 'a+') as lock:
+            lockfile(lock, exclusive=write)
+            try:
+                if write:
+                    db = shelve.open(self._filename, flag='c', protocol=2)
+                elif dbm.whichdb(self._filename):
+                    db = shelve.open(self._filename, flag='r', protocol=2)
+                else: # doesn't exist yet
+                    yield {}
+                    return
+                try:
+                    yield db
+                finally:
+                    db.close()
+            finally:
+                unlockfile(lock)
+
+    def get(self, key, max_age=None):
+        """Returns (True, value) if key is stored (and is at most
+        max_age seconds old, if given), otherwise (False, None)."""
+        with self._opened() as db:
+            try:
+                stored = db['t' + key]
+                value = db['v' + key]
+            except KeyError:
+                return False, None
+        if max_age is not None and stored + max_age <= self.timer():
+            return False, None
+        return True, value
+    def _count(self, db):
+        try:
+            return db['n']
+        except KeyError: # made before we kept count
+            return len([k for k in db.keys() if k.startswith('t')])
+    def set(self, key, value):
+        """Store value under key, evicting old entries if needed."""
+        with self._opened(write=True) as db:
+            count = self._count(db)
+            if 't' + key not in db:
+                count += 1
+            db['v' + key] = value
+            db['t' + key] = self.timer()
+            if self.maxsize is not None and \
+               count > self.maxsize + max(self.maxsize // 4, 1):
+                count = self._evict(db)
+                db['n'] = count
+                self._compact(db)
+            else:
+                db['n'] = count
+    def _evict(self, db):
+        """Remove the oldest entries until there are maxsize.  Returns
+        the number left."""
+        stamps = [(db[k], k[1:]) for k in db.keys() if k.startswith('t')]
+        stamps.sort()
+        for stored, key in stamps[:max(len(stamps) - self.maxsize, 0)]:
+            del db['t' + key]
+            del db['v' + key]
+        return min(len(stamps), self.maxsize)
+    def _compact(self, db):
+        """Reclaim the space used by deleted entries.  Closes db (we
+        still hold the lock)."""
+        db.close()
+        kind = dbm.whichdb(self._filename)
+        if kind == 'dbm.gnu':
+            from dbm import gnu
+            raw = gnu.open(self._filename, 'w')
+            try:
+                raw.reorganize()
+            finally:
+                raw.close()
+        elif kind == 'dbm.dumb':
+            from dbm import dumb
+            temp = '%s.compact%d' % (self._filename, os.getpid())
+            with dumb.open(self._filename, 'r') as raw, \
+                 dumb.open(temp, 'n') as copy:
+                for key in raw.keys(): # copy the pickles without loading
+                    copy[key] = raw[key]
+            for extension in ('.dat', '.dir'):
+                os.replace(temp + extension, self._filename + extension)
+            for leftover in (temp + '.bak', self._filename + '.bak'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+    def __len__(self):
+        with self._opened() as db:
+            if not db:
+                return 0
+            return self._count(db)
+    def clear(self):
+        """Remove all entries."""
+        with self._opened(write=True) as db:
+            db.clear()
+            self._compact(db)
+
+class PersistentMemoizedFunction(MemoizedFunction):
+    """A MemoizedFunction whose results are also stored in a shelve
+    file, so they survive restarts and can be shared by processes using
+    the same file.  The in-memory LRU cache (maxsize, ttl) is checked
+    first, then the file.  Arguments are keyed with stable_hash() along
+    with the function's module and name, so several functions can share
+    one file.  Results must be picklable."""
+    def __init__(self, fn, filename, maxsize=128, ttl=None,
+                 disk_maxsize=None):
+        MemoizedFunction.__init__(self, fn, maxsize=maxsize, ttl=ttl)
+        self.disk = ShelveCache(filename, maxsize=disk_maxsize)
+        self.disk_hits = 0
+        self._name = "%s.%s" % (getattr(fn, '__module__', None),
+                                getattr(fn, '__qualname__', repr(fn)))
+    def _compute(self, key, args, kwargs):
+        diskkey = stable_hash((self._name, key))
+        found, value = self.disk.get(diskkey, max_age=self.ttl)
+        if found:
+            with self._lock:
+                self.disk_hits += 1
+            return value
+        value = self.fn(*args, **kwargs)
+        self.disk.set(diskkey, value)
+        return value
+    def clear(self, disk=True):
+        """Forget all memoized results and reset the statistics.  If
+        disk is False, only the in-memory cache is cleared."""
+        MemoizedFunction.clear(self)
+        self.disk_hits = 0
+        if disk:
+            self.disk.clear()
+    cache_clear = clear
+
+def persistent_memoize(filename, maxsize=128, ttl=None, disk_maxsize=None):
+    """Decorator version of PersistentMemoizedFunction:
+
+    @persistent_memoize('features.cache', disk_maxsize=100000)
+    def extract_features(sentence):
+        ..."""
+    def decorator(fn):
+        return PersistentMemoizedFunction(fn, filename, maxsize=maxsize,
+            ttl=ttl, disk_maxsize=disk_maxsize)
+    return decorator